@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+
+import csv
+import numpy as np
+from automatcher import Event, Track, NOTE_ON_KIND, NOTE_OFF_KIND, event_keys, event_times, levenshtein_path
+
+MATCH, INSERTED, DELETED, RECOVERED = range(4)
+OP_NAMES = ("match", "inserted", "deleted", "recovered")
+OP_SYMBOLS = ("", "-", "+", "!")
+
+BUFFER_SIZE = 1 << 20
+
+def _track_columns(track):
+    # pos, time, key and velocity arrays of a preprocessed track
+    if isinstance(track, Track):
+        return track.pos, track.time, track.keys, track.velocity
+    velocity = [event.midi_event.data[1] if event.midi_event is not None and len(event.midi_event.data) > 1 else 0
+            for event in track]
+    return (np.fromiter((event.pos for event in track), dtype=np.int64, count=len(track)),
+            event_times(track).astype(np.int64), event_keys(track), np.array(velocity, dtype=np.int64))
+
+def _take(column, index):
+    # column values at index, -1 where index is -1
+    if len(column) == 0:
+        return np.full(len(index), -1, dtype=np.int64)
+    return np.where(index >= 0, column[np.maximum(index, 0)], -1)
+
+class Alignment:
+    # Result of a matcher as arrays, one row per aligned pair: indices into the score and performance
+    # sequences (-1 when the row has no event there), the operation and for chord based matchers the chord
+    # of the row. Nothing is formatted until it is written or rendered.
+    def __init__(self, score, performance, score_index, performance_index, op, chord=None):
+        self.score = score
+        self.performance = performance
+        self.score_index = np.asarray(score_index, dtype=np.int64)
+        self.performance_index = np.asarray(performance_index, dtype=np.int64)
+        self.op = np.asarray(op, dtype=np.uint8)
+        self.chord = None if chord is None else np.asarray(chord, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.op)
+
+    # From (score event, performance event) pairs and their symbols. Events are found by pos, which has to be
+    # the index in its track (true for preprocessed tracks). A pair with symbol "!" was recovered from unmatched,
+    # the earlier (None, event) pair of its event is left out so that every performance event is in one row.
+    @staticmethod
+    def from_pairs(score, performance, pairs, symbols, chord=None):
+        recovered = {event.pos for (_, event), symbol in zip(pairs, symbols) if symbol == "!"}
+        if recovered:
+            keep = [score_event is not None or event is None or event.pos not in recovered for score_event, event in pairs]
+            pairs = [pair for pair, kept in zip(pairs, keep) if kept]
+            symbols = [symbol for symbol, kept in zip(symbols, keep) if kept]
+            if chord is not None:
+                chord = [i for i, kept in zip(chord, keep) if kept]
+        score_index = [score_event.pos if score_event is not None else -1 for score_event, _ in pairs]
+        performance_index = [event.pos if event is not None else -1 for _, event in pairs]
+        op = [(RECOVERED if symbol == "!" else MATCH) if score_event is not None and event is not None
+                else (DELETED if event is None else INSERTED) for (score_event, event), symbol in zip(pairs, symbols)]
+        return Alignment(score, performance, score_index, performance_index, op, chord)
+
+    # From the chords of (score event, performance event) pairs and the chords of their symbols
+    # match_two_sorted or PreparedScore.align return.
+    @staticmethod
+    def from_chords(score, performance, all_matched, all_symbols):
+        chord = [i for i, pairs in enumerate(all_matched) for _ in pairs]
+        return Alignment.from_pairs(score, performance, [pair for pairs in all_matched for pair in pairs],
+                [symbol for symbols in all_symbols for symbol in symbols], chord)
+
+    # From a levenshtein_path (indices into score and performance).
+    @staticmethod
+    def from_path(score, performance, path):
+        path = np.array(path, dtype=np.int64).reshape(-1, 2)
+        op = np.where(path[:, 0] < 0, INSERTED, np.where(path[:, 1] < 0, DELETED, MATCH))
+        return Alignment(score, performance, path[:, 0], path[:, 1], op)
+
+    # Columns of every row: op, chord, then pos, time, kind and pitch of the score event and pos, time, kind,
+    # pitch and velocity of the performance event (-1 where there is no event).
+    def columns(self):
+        score_pos, score_time, score_keys, _ = _track_columns(self.score)
+        pos, time, keys, velocity = _track_columns(self.performance)
+        score_key = _take(score_keys, self.score_index)
+        key = _take(keys, self.performance_index)
+        chord = self.chord if self.chord is not None else np.full(len(self), -1, dtype=np.int64)
+        return {
+            "op": self.op, "chord": chord,
+            "score_pos": _take(score_pos, self.score_index), "score_time": _take(score_time, self.score_index),
+            "score_kind": np.where(score_key >= 0, score_key // 128, -1),
+            "score_pitch": np.where(score_key >= 0, score_key % 128, -1),
+            "performance_pos": _take(pos, self.performance_index), "performance_time": _take(time, self.performance_index),
+            "performance_kind": np.where(key >= 0, key // 128, -1),
+            "performance_pitch": np.where(key >= 0, key % 128, -1),
+            "velocity": _take(velocity, self.performance_index)
+        }
+
+    # Rendered rows, one line per row like show_event prints a (score, performance) pair, generated lazily.
+    def lines(self):
+        columns = self.columns()
+        kind_names = {NOTE_ON_KIND: "On", NOTE_OFF_KIND: "Off"}
+        rows = zip(self.op.tolist(), columns["score_pos"].tolist(), columns["score_time"].tolist(),
+                columns["score_kind"].tolist(), columns["score_pitch"].tolist(), columns["performance_pos"].tolist(),
+                columns["performance_time"].tolist(), columns["performance_kind"].tolist(),
+                columns["performance_pitch"].tolist())
+        empty = Event.TEMPLATE.format("", "", "", "", "")
+        for op, *sides in rows:
+            line = []
+            for pos, time, kind, pitch in (sides[:4], sides[4:]):
+                if pos < 0:
+                    line.append(empty)
+                else:
+                    line.append(Event.TEMPLATE.format(pos, time, kind_names.get(kind, "UNK"), pitch, OP_SYMBOLS[op]))
+            yield " ".join(line)
+
+def write_csv(alignment, filename):
+    columns = alignment.columns()
+    with open(filename, "w", newline="", buffering=BUFFER_SIZE) as output:
+        writer = csv.writer(output)
+        writer.writerow(columns.keys())
+        values = [column.tolist() for column in columns.values()]
+        values[0] = [OP_NAMES[op] for op in values[0]]
+        writer.writerows(zip(*values))
+
+def write_jsonl(alignment, filename):
+    columns = alignment.columns()
+    template = "{{" + ",".join('"{}":{{}}'.format(name) for name in columns) + "}}\n"
+    template = template.replace('"op":{}', '"op":"{}"', 1)
+    values = [column.tolist() for column in columns.values()]
+    values[0] = [OP_NAMES[op] for op in values[0]]
+    with open(filename, "w", buffering=BUFFER_SIZE) as output:
+        output.writelines(template.format(*row) for row in zip(*values))
+
+# Name, modifier and octave of a MIDI note number the way match files of version 5.0 write them.
+NOTE_NAMES = (("C", "n"), ("C", "#"), ("D", "n"), ("D", "#"), ("E", "n"), ("F", "n"), ("F", "#"), ("G", "n"),
+        ("G", "#"), ("A", "n"), ("A", "#"), ("B", "n"))
+
+def _note_offsets(time, keys):
+    # For every NoteOn the time of the NoteOff of the same pitch that follows it (or its own time).
+    offsets = time.copy()
+    open_notes = {}
+    for i, (key, t) in enumerate(zip(keys.tolist(), time.tolist())):
+        kind, pitch = divmod(key, 128)
+        if kind == NOTE_ON_KIND:
+            open_notes.setdefault(pitch, []).append(i)
+        elif kind == NOTE_OFF_KIND and open_notes.get(pitch):
+            offsets[open_notes[pitch].pop(0)] = t
+    return offsets
+
+# Writes the NoteOn rows as a version 5.0 match file MatchFile can read. Score times are written in beats of
+# resolution ticks, performance times in milliseconds (midiClockRate 500000, one quarter note in half a second),
+# so events_from_match gives back the ticks of the tracks.
+def write_match(alignment, filename, resolution=4000):
+    score_pos, score_time, score_keys, _ = _track_columns(alignment.score)
+    pos, time, keys, velocity = _track_columns(alignment.performance)
+    score_offsets = _note_offsets(score_time, score_keys).tolist()
+    offsets = _note_offsets(time, keys).tolist()
+    score_pos, score_time, score_keys = score_pos.tolist(), score_time.tolist(), score_keys.tolist()
+    pos, time, keys, velocity = pos.tolist(), time.tolist(), keys.tolist(), velocity.tolist()
+    milliseconds = resolution * 1000 / 500000 # ticks per millisecond
+    lines = ["info(matchFileVersion,5.0).\n", "info(midiClockUnits,{}).\n".format(resolution),
+            "info(midiClockRate,500000).\n"]
+    rows = zip(alignment.score_index.tolist(), alignment.performance_index.tolist())
+    for i, j in rows:
+        if (i >= 0 and score_keys[i] // 128 != NOTE_ON_KIND) or (j >= 0 and keys[j] // 128 != NOTE_ON_KIND):
+            continue
+        if i >= 0:
+            name, modifier = NOTE_NAMES[score_keys[i] % 128 % 12]
+            left = "snote(n{},[{},{}],{},0:0,0,0,{!r},{!r},[])".format(score_pos[i], name, modifier,
+                    score_keys[i] % 128 // 12 - 1, score_time[i] / resolution, score_offsets[i] / resolution)
+        else:
+            left = "insertion"
+        if j >= 0:
+            name, modifier = NOTE_NAMES[keys[j] % 128 % 12]
+            right = "note({0},[{1},{2}],{3},{4!r},{5!r},{5!r},{6})".format(pos[j], name, modifier, keys[j] % 128 // 12 - 1,
+                    time[j] / milliseconds, offsets[j] / milliseconds, velocity[j])
+        else:
+            right = "deletion"
+        lines.append("{}-{}.\n".format(left, right))
+    with open(filename, "w", buffering=BUFFER_SIZE) as output:
+        output.writelines(lines)
+
+# stats is an optional instrumentation.MatchStats for the matchers.
+def align_levenshtein(score, performance, stats=None):
+    path = levenshtein_path(score, performance, stats)
+    # match_levenshtein never compares the first events, here they are in the alignment too
+    if len(score) and len(performance):
+        if event_keys(score[:1])[0] == event_keys(performance[:1])[0]:
+            path.insert(0, (0, 0))
+        else:
+            path[:0] = [(0, -1), (-1, 0)]
+    elif len(score) or len(performance):
+        path = [(i, -1) for i in range(len(score))] + [(-1, j) for j in range(len(performance))]
+    return Alignment.from_path(score, performance, path)
+
+def align_sorted(score, performance, max_gap_size=None, max_unmatched=None, time_tolerance=None, stats=None):
+    from prepared import PreparedScore
+    return Alignment.from_chords(score, performance,
+            *PreparedScore(score, time_tolerance).align(performance, max_gap_size, max_unmatched, stats))
+
+def align_unsorted(score, performance, max_gap_size=None, max_unmatched=None, time_tolerance=None, stats=None):
+    from prepared import PreparedScore
+    return Alignment.from_chords(score, performance,
+            *PreparedScore(score, time_tolerance).align_unsorted(performance, max_gap_size, max_unmatched, stats))
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "match": write_match}
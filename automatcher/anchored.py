@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from automatcher import Event, MarkedEvents, NOTE_ON_KIND, event_keys, event_times, match_levenshtein
+
+MAX_NGRAM = 9 # pitches of an n-gram are packed into one int64, 7 bits each
+
+# Default chord tolerance, 40ms in the .mid files match_to_midi writes (8 ticks per millisecond).
+CHORD_TOLERANCE = 320
+
+# Without a min_segment, segments are about 1/SEGMENTS of the score but at least MIN_SEGMENT events long.
+SEGMENTS = 16
+MIN_SEGMENT = 32
+
+def chord_tops(track, time_tolerance=CHORD_TOLERANCE):
+    # Chords of the NoteOn events (onsets at most time_tolerance apart, in whatever order they were played):
+    # index of the first NoteOn of each chord in the track and its highest pitch. Notes of a chord are
+    # played in a different order than the score has them, the highest one is usually the melody.
+    keys = event_keys(track)
+    positions = np.flatnonzero(keys // 128 == NOTE_ON_KIND)
+    if len(positions) == 0:
+        return positions, positions
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(event_times(track)[positions]) > time_tolerance) + 1))
+    return positions[starts], np.maximum.reduceat(keys[positions] % 128, starts)
+
+def _unique_ngrams(track, n, time_tolerance):
+    # Codes of the n-grams of chord top pitches that occur once, and the positions where they start.
+    positions, pitches = chord_tops(track, time_tolerance)
+    count = max(len(pitches) - n + 1, 0)
+    codes = np.zeros(count, dtype=np.int64)
+    for k in range(n):
+        codes = (codes << 7) | pitches[k:k + count]
+    codes, first, counts = np.unique(codes, return_index=True, return_counts=True)
+    return codes[counts == 1], positions[first[counts == 1]]
+
+def _longest_increasing(gold_positions, other_positions):
+    # Longest chain of anchors (sorted by gold position) that are in the same order in other (patience sort).
+    tails, tail_indices, previous = [], [], []
+    for i, position in enumerate(other_positions):
+        k = bisect_left(tails, position)
+        if k == len(tails):
+            tails.append(position)
+            tail_indices.append(i)
+        else:
+            tails[k] = position
+            tail_indices[k] = i
+        previous.append(tail_indices[k - 1] if k > 0 else -1)
+    result = []
+    i = tail_indices[-1] if tail_indices else -1
+    while i >= 0:
+        result.append((gold_positions[i], other_positions[i]))
+        i = previous[i]
+    return result[::-1]
+
+# (gold index, other index) pairs of chords that start an n-gram of chord top pitches occurring exactly once in
+# each track, the longest chain of them that is in the same order in both.
+def find_anchors(gold, other, n=6, time_tolerance=CHORD_TOLERANCE):
+    if not 0 < n <= MAX_NGRAM:
+        raise ValueError("n-grams can have 1 to {} pitches.".format(MAX_NGRAM))
+    gold_codes, gold_positions = _unique_ngrams(gold, n, time_tolerance)
+    other_codes, other_positions = _unique_ngrams(other, n, time_tolerance)
+    _, gold_index, other_index = np.intersect1d(gold_codes, other_codes, assume_unique=True, return_indices=True)
+    gold_positions, other_positions = gold_positions[gold_index], other_positions[other_index]
+    order = np.argsort(gold_positions)
+    return _longest_increasing(gold_positions[order].tolist(), other_positions[order].tolist())
+
+def default_min_segment(gold_length):
+    return max(MIN_SEGMENT, gold_length // SEGMENTS)
+
+# Where both tracks are cut, starting with (0, 0). Segments are at least min_segment gold events long.
+def anchored_cuts(anchors, min_segment=MIN_SEGMENT):
+    cuts = [(0, 0)]
+    for gold_position, other_position in anchors:
+        if gold_position - cuts[-1][0] >= min_segment and other_position > cuts[-1][1]:
+            cuts.append((gold_position, other_position))
+    return cuts
+
+def _align_segment(arguments):
+    # Only keys are sent to the workers, the alignment comes back as (symbol, position in the segment).
+    # match_levenshtein never compares the first events of its tracks, segments after the first one start
+    # with a placeholder event (key -1) in both so that no event is lost.
+    gold_keys, other_keys, placeholder, engine = arguments
+    gold_keys, other_keys = gold_keys.tolist(), other_keys.tolist()
+    if placeholder:
+        gold_keys, other_keys = [-1] + gold_keys, [-1] + other_keys
+    gold = [Event(None, i - placeholder, 0, key=key, tick=0) for i, key in enumerate(gold_keys)]
+    other = [Event(None, j - placeholder, 0, key=key, tick=0) for j, key in enumerate(other_keys)]
+    return [(symbol, event.pos) for event, symbol in zip(*match_levenshtein(gold, other, engine))]
+
+# match_levenshtein of the segments between anchors, stitched together into one MarkedEvents. Without anchors
+# this is match_levenshtein(gold, other). Segments are aligned in a process pool (executor, or a new one with the
+# given number of workers), workers=1 aligns them in this process. min_segment is default_min_segment(len(gold))
+# by default.
+def match_anchored(gold, other, n=6, time_tolerance=CHORD_TOLERANCE, min_segment=None, workers=None, executor=None,
+        engine="linear"):
+    if min_segment is None:
+        min_segment = default_min_segment(len(gold))
+    gold_keys, other_keys = event_keys(gold), event_keys(other)
+    cuts = anchored_cuts(find_anchors(gold, other, n, time_tolerance), min_segment)
+    bounds = cuts + [(len(gold), len(other))]
+    jobs = [(gold_keys[gold_start:gold_end], other_keys[other_start:other_end], gold_start > 0, engine)
+            for (gold_start, other_start), (gold_end, other_end) in zip(bounds, bounds[1:])]
+    if executor is not None:
+        segments = executor.map(_align_segment, jobs)
+    elif workers == 1 or len(jobs) == 1:
+        segments = map(_align_segment, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            segments = list(executor.map(_align_segment, jobs))
+
+    result = []
+    symbols = []
+    for (gold_start, other_start), segment in zip(cuts, segments):
+        for symbol, pos in segment:
+            result.append(gold[gold_start + pos] if symbol == "+" else other[other_start + pos])
+            symbols.append(symbol)
+    return MarkedEvents(result, symbols)
+
+if __name__ == '__main__':
+
+    import argparse, time
+    from automatcher import read_track, show_event
+
+    parser = argparse.ArgumentParser(description='Aligns a performance with a score segment by segment between anchors.')
+    parser.add_argument('score_file', type=str,
+                        help='score .mid file')
+    parser.add_argument('performance_file', type=str,
+                        help='performance .mid file')
+    parser.add_argument('--ngram', '-n', dest='n', type=int, default=6,
+                        help='number of chords in an anchor')
+    parser.add_argument('--chord-tolerance', '-t', dest='time_tolerance', type=int, default=CHORD_TOLERANCE,
+                        help='onsets at most this many ticks apart are one chord')
+    parser.add_argument('--min-segment', '-m', dest='min_segment', type=int, default=None,
+                        help='minimum number of score events in a segment, 1/{} of the score by default'.format(SEGMENTS))
+    parser.add_argument('--workers', '-w', dest='workers', type=int, default=None,
+                        help='number of worker processes, number of CPUs by default')
+    parser.add_argument('--quiet', '-q', action='store_const',
+                        default = False, const = True,
+                        help='only prints the summary')
+
+    args = parser.parse_args()
+    gold, other = read_track(args.score_file), read_track(args.performance_file)
+    start = time.perf_counter()
+    min_segment = args.min_segment if args.min_segment is not None else default_min_segment(len(gold))
+    cuts = anchored_cuts(find_anchors(gold, other, args.n, args.time_tolerance), min_segment)
+    events, symbols = match_anchored(gold, other, args.n, args.time_tolerance, min_segment, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    if not args.quiet:
+        print("\n".join(map(show_event, events, symbols)))
+    print("{} segments, {} events in {:.3f}s".format(len(cuts), len(events), elapsed))
@@ -1,14 +1,19 @@
 #!/usr/bin/python3
 
-import midi
-from itertools import zip_longest, chain
-from functools import lru_cache
+import time
+import numpy as np
+from midifile import read_notes
+from collections import namedtuple, deque, OrderedDict
 from enum import Enum
-from copy import copy, deepcopy
+
+try:
+    import midi
+except ImportError: # .mid files can still be read with read_track
+    midi = None
 
 INF = float("inf")
 
-interesting_event_types = (midi.NoteOnEvent, midi.NoteOffEvent)
+interesting_event_types = (midi.NoteOnEvent, midi.NoteOffEvent) if midi is not None else ()
 def default_event_filter(event):
     return type(event) in interesting_event_types
 
@@ -19,20 +24,51 @@ def default_event_comparer(a, b):
         return False
     return a.data[0] == b.data[0]
 
+# The kinds of NoteOn and NoteOff events are always 0 and 1, other event types get the next kinds.
+NOTE_ON_KIND, NOTE_OFF_KIND = 0, 1
+event_kind_types = list(interesting_event_types) if midi is not None else [None, None]
+event_kinds = {kind: i for i, kind in enumerate(event_kind_types)}
+event_kind_names = ["On", "Off"]
+event_type_names = {
+    midi.ControlChangeEvent : "CCE",
+    midi.SetTempoEvent : "STe",
+    midi.EndOfTrackEvent : "EOT"
+} if midi is not None else {}
+
+def event_key(midi_event):
+    # Integer that is equal for two events exactly when default_event_comparer considers them similar.
+    kind = event_kinds.get(type(midi_event))
+    if kind is None:
+        kind = event_kinds[type(midi_event)] = len(event_kind_types)
+        event_kind_types.append(type(midi_event))
+        event_kind_names.append(event_type_names.get(type(midi_event), "UNK"))
+    return kind * 128 + (midi_event.data[0] if midi_event.data else 0)
+
+def event_keys(track):
+    if isinstance(track, Track):
+        return track.keys
+    return np.fromiter((event.key for event in track), dtype=np.int64, count=len(track))
+
+def event_times(track):
+    if isinstance(track, Track):
+        return track.time.astype(np.float64)
+    return np.fromiter((event.time for event in track), dtype=np.float64, count=len(track))
+
 class Event:
-    def __init__(self, midi_event, pos, time):
+    __slots__ = ("midi_event", "pos", "time", "symbol", "key", "tick")
+
+    # midi_event can be None if key is given (events materialized from a Track), tick is then 0 unless given.
+    def __init__(self, midi_event, pos, time, key=None, tick=None):
+        if midi_event is None and key is None:
+            raise ValueError("An Event without midi_event needs a key.")
         self.midi_event = midi_event
         self.pos = pos
         self.time = time
         self.symbol = None
-
-    event_type_names = {
-        midi.ControlChangeEvent : "CCE",
-        midi.SetTempoEvent : "STe",
-        midi.NoteOnEvent : "On",
-        midi.NoteOffEvent : "Off",
-        midi.EndOfTrackEvent : "EOT"
-    }
+        self.key = event_key(midi_event) if key is None else key
+        if tick is None:
+            tick = midi_event.tick if midi_event is not None else 0
+        self.tick = tick
 
     SHOW_TIME = True
     LONG_SYMBOL = True
@@ -46,22 +82,107 @@ class Event:
     TEMPLATE += " |"
 
     def __str__(self):
-        typestr = Event.event_type_names.get(type(self.midi_event), "UNK")
+        return self.show(self.symbol)
+
+    # The event shown with the given symbol instead of its own (e.g. a symbol a matcher returned for it).
+    def show(self, symbol):
+        kind = self.key // 128
+        typestr = event_kind_names[kind]
         data = ""
-        if type(self.midi_event) in (midi.NoteOnEvent, midi.NoteOffEvent):
-            data = self.midi_event.data[0]
-        symbol = self.symbol if self.symbol else ""
+        if kind in (NOTE_ON_KIND, NOTE_OFF_KIND):
+            data = self.key % 128
+        symbol = symbol if symbol else ""
         return Event.TEMPLATE.format(self.pos, self.time, typestr, data, symbol)
 
     def is_similar(self, other): 
         if other is None:
             return False
-        return default_event_comparer(self.midi_event, other.midi_event)
-
-
-def preprocess(track):
+        return self.key == other.key
+
+class Track:
+    # Columnar storage of a preprocessed track, one array per event attribute. Indexing or iterating
+    # materializes Event objects (without midi_event and symbol) on demand, array based matchers read the
+    # columns directly. Matchers mark the Events they are given, so a Track matched more than once (like
+    # match_two_sorted and then match_levenshtein) has to be materialized with list(track) first.
+    COLUMNS = ("pos", "time", "tick", "kind", "pitch", "velocity")
+
+    def __init__(self, pos, time, tick, kind, pitch, velocity):
+        self.pos = np.asarray(pos, dtype=np.int32)
+        self.time = np.asarray(time, dtype=np.int64)
+        self.tick = np.asarray(tick, dtype=np.int32)
+        self.kind = np.asarray(kind, dtype=np.uint8)
+        self.pitch = np.asarray(pitch, dtype=np.uint8)
+        self.velocity = np.asarray(velocity, dtype=np.uint8)
+
+    @staticmethod
+    def from_midi(midi_events):
+        columns = tuple([] for _ in Track.COLUMNS)
+        pos, time, tick, kind, pitch, velocity = columns
+        current_time = 0
+        for i, event in enumerate(midi_events):
+            current_time += event.tick
+            key = event_key(event)
+            pos.append(i)
+            time.append(current_time)
+            tick.append(event.tick)
+            kind.append(key // 128)
+            pitch.append(key % 128)
+            velocity.append(event.data[1] if len(event.data) > 1 else 0)
+        return Track(*columns)
+
+    @staticmethod
+    def from_events(events):
+        key = event_keys(events)
+        velocity = [event.midi_event.data[1] if event.midi_event is not None else 0 for event in events]
+        return Track([event.pos for event in events], [event.time for event in events],
+                [event.tick for event in events], key // 128, key % 128, velocity)
+
+    RECORD_DTYPE = np.dtype([("pos", "<i4"), ("time", "<i8"), ("tick", "<i4"), ("kind", "u1"), ("pitch", "u1"),
+            ("velocity", "u1")])
+
+    # All columns in one structured array (e.g. to save it).
+    def to_records(self):
+        records = np.empty(len(self), dtype=Track.RECORD_DTYPE)
+        for column in Track.COLUMNS:
+            records[column] = getattr(self, column)
+        return records
+
+    # The columns are views of the records, so a memory-mapped array is not read until used.
+    @staticmethod
+    def from_records(records):
+        return Track(*(records[column] for column in Track.COLUMNS))
+
+    @property
+    def keys(self):
+        return self.kind.astype(np.int64) * 128 + self.pitch
+
+    def __len__(self):
+        return len(self.pos)
+
+    def event(self, i):
+        return Event(None, int(self.pos[i]), int(self.time[i]), key=int(self.kind[i]) * 128 + int(self.pitch[i]),
+                tick=int(self.tick[i]))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Track(*(getattr(self, column)[index] for column in Track.COLUMNS))
+        return self.event(index)
+
+    CHUNK = 1024
+
+    def __iter__(self):
+        for start in range(0, len(self), Track.CHUNK):
+            chunk = slice(start, start + Track.CHUNK)
+            keys = self.kind[chunk].astype(np.int64) * 128 + self.pitch[chunk]
+            columns = zip(self.pos[chunk].tolist(), self.time[chunk].tolist(), keys.tolist(), self.tick[chunk].tolist())
+            for pos, time, key, tick in columns:
+                yield Event(None, pos, time, key=key, tick=tick)
+
+def preprocess(track, columnar=False):
     
     track = filter(default_event_filter, track) # Remove unwanted events
+    if columnar:
+        return Track.from_midi(track)
     result = []
     time = 0
     for i, event in enumerate(track):
@@ -69,11 +190,61 @@ def preprocess(track):
         result.append(Event(event, i, time))
     return result
 
-def group_events(track):
+# The same as preprocess(midi.read_midifile(filename)[track_index]) without python-midi, only NoteOn/NoteOff
+# messages are decoded. Like preprocess, times only add up the ticks of the notes. Events have no midi_event.
+def read_track(filename, columnar=False, track_index=0, zero_velocity_off=False):
+    notes = read_notes(filename, track_index, zero_velocity_off)
+    times = np.cumsum(notes.tick, dtype=np.int64)
+    if columnar:
+        return Track(np.arange(len(times)), times, notes.tick, notes.is_off, notes.pitch, notes.velocity)
+    keys = notes.is_off.astype(np.int64) * 128 + notes.pitch
+    return [Event(None, i, time, key=key, tick=tick)
+            for i, (time, key, tick) in enumerate(zip(times.tolist(), keys.tolist(), notes.tick.tolist()))]
+
+# The Events preprocess returns for the track match_file.get_pattern writes, built directly from the notes
+# of a match_to_midi.MatchFile without MIDI serialization. With quantize=False times are not truncated to
+# ticks (and are Decimals or floats).
+def events_from_match(match_file, score_notes=True, time_scaling=None, quantize=True, columnar=False):
+    if columnar and not quantize:
+        raise ValueError("Columnar tracks need quantized ticks.")
+    if time_scaling is None:
+        time_scaling = match_file.default_time_scaling(score_notes)
+    kinds = (NOTE_ON_KIND, NOTE_OFF_KIND)
+    events = match_file.get_events(time_scaling, score_notes, quantize)
+    if columnar:
+        ticks = [tick for tick, _, _, _ in events]
+        return Track(range(len(events)), np.cumsum(ticks, dtype=np.int64), ticks,
+                [kinds[is_off] for _, is_off, _, _ in events], [pitch for _, _, pitch, _ in events],
+                [velocity for _, _, _, velocity in events])
+    result = []
+    time = 0
+    for i, (tick, is_off, pitch, _) in enumerate(events):
+        time += tick
+        result.append(Event(None, i, time, key=kinds[is_off] * 128 + pitch, tick=tick))
+    return result
+
+# Indices of the first events of the chords of a track. A chord is the events at most time_tolerance after its
+# first event, so notes of a played chord a few ticks apart stay together while a fast run or trill of close
+# notes is not chained into one chord. With time_tolerance=0 these are the chords of group_events(track) (times
+# add up the ticks).
+def chord_starts(track, time_tolerance=0):
+    times = event_times(track)
+    starts = []
+    start = 0
+    while start < len(times):
+        starts.append(start)
+        start = int(np.searchsorted(times, times[start] + time_tolerance, side="right"))
+    return np.array(starts, dtype=np.int64)
+
+def group_events(track, time_tolerance=None):
+    if time_tolerance is not None:
+        starts = chord_starts(track, time_tolerance).tolist()
+        events = list(track) if isinstance(track, Track) else track
+        return [events[start:end] for start, end in zip(starts, starts[1:] + [len(events)])]
     result = []
     current_group = []
     for event in track:
-        if event.midi_event.tick == 0:
+        if event.tick == 0:
             current_group.append(event)
         else:
             if current_group:
@@ -83,172 +254,311 @@ def group_events(track):
         result.append(current_group)
     return result
 
+def index_targets(target_events):
+    # key -> deque of positions of target events with that key
+    index = {}
+    for j, target_event in enumerate(target_events):
+        index.setdefault(target_event.key, deque()).append(j)
+    return index
+
+class UnmatchedEvents:
+    # Events waiting to be matched later, oldest first, indexed by key.
+    def __init__(self):
+        self.events = OrderedDict() # sequence number -> event
+        self.index = {} # key -> deque of sequence numbers of events with that key
+        self.added = 0
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events.values())
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def add(self, events):
+        for event in events:
+            self.events[self.added] = event
+            self.index.setdefault(event.key, deque()).append(self.added)
+            self.added += 1
+
+    def _forget(self, key):
+        sequence_numbers = self.index[key]
+        sequence_number = sequence_numbers.popleft()
+        if not sequence_numbers:
+            del self.index[key]
+        return sequence_number
+
+    # Removes the oldest event with the given key, returns its sequence number and the event.
+    def take(self, key):
+        sequence_number = self._forget(key)
+        return sequence_number, self.events.pop(sequence_number)
+
+    def trim(self, max_unmatched):
+        if not max_unmatched: # same as unmatched[-max_unmatched:], 0 keeps everything
+            return
+        while len(self.events) > max_unmatched:
+            _, event = self.events.popitem(last=False)
+            self._forget(event.key)
+
+    # Matches unmatched events to the free targets the way find_matching_sorted does, marks them in matched.
+    # Returns the (target, event) pairs in the order the events became unmatched, their symbol is "!".
+    def recover_sorted(self, target_events, free_targets, matched):
+        recovered = []
+        for key, targets in free_targets.items():
+            while targets and key in self.index:
+                sequence_number, event = self.take(key)
+                j = targets.popleft()
+                target_event = target_events[j]
+                if event.symbol == "U":
+                    event.symbol = "M-" + str(target_event.pos)
+                recovered.append((sequence_number, target_event, event))
+                matched[j] = True
+        recovered.sort(key=lambda item: item[0])
+        return [(target_event, event) for _, target_event, event in recovered]
+
 class TrackIterator:
-    def __init__(self, data):
+    # groups are precomputed chords of data (e.g. group_events(data, time_tolerance)) that get_next_events
+    # returns instead of the events that take 0 time. Only use get_next_events then. stats is an optional
+    # instrumentation.MatchStats the find_matching methods report every call to.
+    def __init__(self, data, groups=None, stats=None):
         self.iterator = iter(data)
-        self.unmatched = []
+        self.groups = iter(groups) if groups is not None else None
+        self.stats = stats
+        self.pending = deque() # events pushed back in front of the iterator (and peeked events)
+        self.unmatched_events = UnmatchedEvents()
         self.iter_pos = 0
         self.time = 0
-        self.peeked = None
+
+    @property
+    def unmatched(self):
+        return list(self.unmatched_events)
 
     def get_next(self):
-        event = self.peeked 
-        self.peeked = None
-        if event is None:
-            event = next(self.iterator)
+        event = self.pending.popleft() if self.pending else next(self.iterator)
         self.time = event.time
         self.iter_pos += 1
         return event
 
     def peek_next(self):
-        if self.peeked is not None:
-            return self.peeked
-        self.peeked = next(self.iterator)
-        return self.peeked
+        if not self.pending:
+            self.pending.append(next(self.iterator))
+        return self.pending[0]
+
+    def push_back(self, events):
+        self.pending.extendleft(reversed(events))
 
     # Finds the next event and all events that match it's time.
     def get_next_events(self):
+        if self.groups is not None:
+            result = list(next(self.groups))
+            self.time = result[-1].time
+            self.iter_pos += len(result)
+            return result
         result = [self.get_next()]
         try:
-            while self.peek_next().midi_event.tick == 0: # if takes 0 time
+            while self.peek_next().tick == 0: # if takes 0 time
                 result.append(self.get_next())
         except StopIteration:
             pass # return what we already found, next get_next_events will fail from get_next() on the first line
         return result
 
-    def find_matching(self, target_events, max_gap_size=None, max_unmatched=None):
+    # free_targets is index_targets(target_events) if it was already computed, it is used up.
+    # Returns the event matched to every target (or None) and the symbol of every match: "!" if the event
+    # was matched from unmatched, None otherwise.
+    def find_matching(self, target_events, max_gap_size=None, max_unmatched=None, free_targets=None):
         results = [None for target in target_events]
-
-        if max_unmatched is not None:
-            self.unmatched = self.unmatched[-max_unmatched:]
-
-        for i, event in enumerate(self.unmatched):
-            for j, target_event in enumerate(target_events):
-                if event.is_similar(target_event) and results[j] is None:
-                    self.unmatched[i] = None
-                    event = copy(event)
-                    event.symbol = "!"
-                    results[j] = event
-                    break
-        # clean up unmatched (no deletion during iteration)
-        self.unmatched = [x for x in self.unmatched if x is not None]
-
+        symbols = [None for target in target_events]
+        self.unmatched_events.trim(max_unmatched)
+        if free_targets is None:
+            free_targets = index_targets(target_events)
+        remaining = len(target_events)
+
+        # Each unmatched event (oldest first) takes the first free similar target.
+        for key, targets in free_targets.items():
+            while targets and key in self.unmatched_events:
+                _, event = self.unmatched_events.take(key)
+                j = targets.popleft()
+                results[j] = event
+                symbols[j] = "!"
+                remaining -= 1
+        recovered = len(target_events) - remaining
+
+        stats = self.stats
+        if stats is not None:
+            unmatched_lookups = self._unmatched_lookups(free_targets, recovered)
+        start_pos = self.iter_pos
         maybe_unmatched = []
-        while (max_gap_size is None or len(maybe_unmatched) <= max_gap_size) and not all(results):
+        while (max_gap_size is None or len(maybe_unmatched) <= max_gap_size) and remaining:
             try:
                 event = self.get_next()
             except StopIteration:
                 break
-            for j, target_event in enumerate(target_events):
-                if event.is_similar(target_event) and results[j] is None:
-                    # store unmatched
-                    self.unmatched += maybe_unmatched
-                    maybe_unmatched = []
-                    results[j] = copy(event)
-                    break
+            targets = free_targets.get(event.key)
+            if targets:
+                # store unmatched
+                if maybe_unmatched and stats is not None:
+                    stats.gap(len(maybe_unmatched))
+                self.unmatched_events.add(maybe_unmatched)
+                maybe_unmatched = []
+                results[targets.popleft()] = event
+                remaining -= 1
             else: # if we didn't match this event
                 maybe_unmatched.append(event)
-        
-        # this breaks peeking, should probably use stack instead of iterator
-        self.iterator = chain(maybe_unmatched, self.iterator)
-        return results
-
-    def find_matching_sorted(self, target_events, max_gap_size=None, max_unmatched=None):
-        target_events = copy(target_events)
-        result = []
-
-        if max_unmatched is not None:
-            self.unmatched = self.unmatched[-max_unmatched:]
-
-        for i, event in enumerate(self.unmatched):
-            for j, target_event in enumerate(target_events):
-                if event.is_similar(target_event):
-                    self.unmatched[i] = None
-                    if event.symbol == "U":
-                        event.symbol = "M-" + str(target_event.pos)
-                    event = copy(event)
-                    event.symbol = "!"
-                    result.append((target_event, event))
-                    target_events[j] = None
-                    break
-        # clean up unmatched (no deletion during iteration)
-        self.unmatched = [x for x in self.unmatched if x is not None]
 
+        self.push_back(maybe_unmatched)
+        if stats is not None:
+            self._report(target_events, unmatched_lookups, start_pos, recovered, max_gap_size, maybe_unmatched)
+        return results, symbols
+
+    @staticmethod
+    def _unmatched_lookups(free_targets, recovered):
+        # Recovering looks the key of every target up among the unmatched events until its targets run out or
+        # the key is not there: once per recovered event and once more for every key with targets left.
+        return recovered + sum(1 for targets in free_targets.values() if targets)
+
+    # key_lookups are the lookups of target keys among the unmatched events and one lookup in the targets per
+    # event read.
+    def _report(self, target_events, unmatched_lookups, start_pos, recovered, max_gap_size, maybe_unmatched):
+        read = self.iter_pos - start_pos
+        self.stats.chord(len(target_events), read, unmatched_lookups + read, recovered,
+                max_gap_size is not None and len(maybe_unmatched) > max_gap_size, len(maybe_unmatched),
+                len(self.unmatched_events))
+
+    # Returns the (target, event) pairs and the symbol of every pair like find_matching.
+    def find_matching_sorted(self, target_events, max_gap_size=None, max_unmatched=None, free_targets=None):
+        matched = [False for target in target_events]
+        self.unmatched_events.trim(max_unmatched)
+        if free_targets is None:
+            free_targets = index_targets(target_events)
+        result = self.unmatched_events.recover_sorted(target_events, free_targets, matched)
+        recovered = len(result)
+        remaining = len(target_events) - recovered
+
+        stats = self.stats
+        if stats is not None:
+            unmatched_lookups = self._unmatched_lookups(free_targets, recovered)
+        start_pos = self.iter_pos
         maybe_unmatched = []
-        while (max_gap_size is None or len(maybe_unmatched) <= max_gap_size) and any(target_events):
+        while (max_gap_size is None or len(maybe_unmatched) <= max_gap_size) and remaining:
             try:
                 event = self.get_next()
             except StopIteration:
                 break
-            for j, target_event in enumerate(target_events):
-                if event.is_similar(target_event):
-                    # store unmatched
-                    for unmatched_event in maybe_unmatched:
-                        unmatched_event.symbol = "U"
-                        result.append((None, unmatched_event))
-                    self.unmatched += maybe_unmatched
-                    maybe_unmatched = []
-                    result.append((target_event, event))
-                    target_events[j] = None
-                    break
+            targets = free_targets.get(event.key)
+            if targets:
+                # store unmatched
+                if maybe_unmatched and stats is not None:
+                    stats.gap(len(maybe_unmatched))
+                for unmatched_event in maybe_unmatched:
+                    unmatched_event.symbol = "U"
+                    result.append((None, unmatched_event))
+                self.unmatched_events.add(maybe_unmatched)
+                maybe_unmatched = []
+                j = targets.popleft()
+                result.append((target_events[j], event))
+                matched[j] = True
+                remaining -= 1
             else: # if we didn't match this event
                 maybe_unmatched.append(event)
-        
-        # this breaks peeking, should probably use stack instead of iterator
-        self.iterator = chain(maybe_unmatched, self.iterator)
-        return result + [(unmatched_target, None) for unmatched_target in target_events if unmatched_target is not None]
 
-def show_event(event):
+        self.push_back(maybe_unmatched)
+        if stats is not None:
+            self._report(target_events, unmatched_lookups, start_pos, recovered, max_gap_size, maybe_unmatched)
+        result += [(target_event, None) for j, target_event in enumerate(target_events) if not matched[j]]
+        return result, ["!"] * recovered + [None] * (len(result) - recovered)
+
+# symbol is shown instead of the symbol of the event unless it is None.
+def show_event(event, symbol=None):
     if event is None:
         return Event.TEMPLATE.format("", "", "", "", "")
-    return str(event)
-
-def match(gold, others, print_unmatched=False, sort_by=None, max_gap_size=None, max_unmatched=None):
-    gold_iter = TrackIterator(gold)
-    other_iters = [TrackIterator(other) for other in others]
+    if symbol is None:
+        return str(event)
+    return event.show(symbol)
+
+# stats (an instrumentation.MatchStats) gets the counters of find_matching and the time spent matching and printing.
+# Returns the blocks of (gold event, event of every other track) tuples, printed only with print_pairs=True, and
+# the blocks of their symbols (find_matching).
+def match(gold, others, print_unmatched=False, sort_by=None, max_gap_size=None, max_unmatched=None, gold_groups=None,
+        stats=None, print_pairs=False):
+    gold_iter = TrackIterator(gold, gold_groups)
+    other_iters = [TrackIterator(other, stats=stats) for other in others]
+    all_matched = []
+    all_symbols = []
 
     while True:
         try:
             gold_events = gold_iter.get_next_events()
         except StopIteration:
             break
+        if stats is not None:
+            start = time.perf_counter()
         matched = []
+        symbols = []
         for other_iter in other_iters:
-            matched.append(other_iter.find_matching(gold_events, max_gap_size, max_unmatched))
-        block = zip(gold_events, *matched)
+            events, event_symbols = other_iter.find_matching(gold_events, max_gap_size, max_unmatched)
+            matched.append(events)
+            symbols.append(event_symbols)
+        if stats is not None:
+            stats.time("match", time.perf_counter() - start)
+            start = time.perf_counter()
+        block = list(zip(gold_events, *matched))
+        block_symbols = list(zip([None] * len(gold_events), *symbols))
         if sort_by is not None:
-            block = sorted(block, key=lambda x: x[sort_by].time if x[sort_by] is not None else INF)
-        for pair in block:
-            print(*map(show_event, pair))
+            rows = sorted(zip(block, block_symbols),
+                    key=lambda x: x[0][sort_by].time if x[0][sort_by] is not None else INF)
+            block, block_symbols = [pair for pair, _ in rows], [pair_symbols for _, pair_symbols in rows]
+        all_matched.append(block)
+        all_symbols.append(block_symbols)
+        if not print_pairs:
+            continue
+        for pair, pair_symbols in zip(block, block_symbols):
+            print(*map(show_event, pair, pair_symbols))
         if print_unmatched:
             for i, other_iter in enumerate(other_iters):
                 if other_iter.unmatched: # These are filtered through max_unmathed
                     print("Currently unmatched in {}:".format(i + 1), *(x.pos for x in other_iter.unmatched))
         print((str.translate(show_event(None), str.maketrans({' ': '-', '|': '+'})) + "-") * (len(others) + 1))
-
-def match_two_sorted(gold, other, max_gap_size=None, max_unmatched=None):
-    gold_iter = TrackIterator(gold)
-    other_iter = TrackIterator(other)
+        if stats is not None:
+            stats.time("output", time.perf_counter() - start)
+
+    return all_matched, all_symbols
+
+# The chords of (gold event, other event) pairs, printed with the events never matched if print_pairs=True, and
+# the chords of their symbols (find_matching_sorted).
+def match_two_sorted(gold, other, max_gap_size=None, max_unmatched=None, gold_groups=None, stats=None,
+        print_pairs=False):
+    start = time.perf_counter()
+    gold_iter = TrackIterator(gold, gold_groups)
+    other_iter = TrackIterator(other, stats=stats)
     all_matched = []
+    all_symbols = []
 
     while True:
         try:
             gold_events = gold_iter.get_next_events()
         except StopIteration:
             break
-        all_matched.append(other_iter.find_matching_sorted(gold_events, max_gap_size, max_unmatched))
-        matched = all_matched[-1]
+        matched, symbols = other_iter.find_matching_sorted(gold_events, max_gap_size, max_unmatched)
+        all_matched.append(matched)
+        all_symbols.append(symbols)
 
         #for pair in matched:
         #    print(*map(show_event, pair))
         #print((str.translate(show_event(None), str.maketrans({' ': '-', '|': '+'})) + "-") * 2)
         #print("Unm: ", *map(show_event, other_iter.unmatched))
 
+    if stats is not None:
+        stats.time("match", time.perf_counter() - start)
+        start = time.perf_counter()
+    if not print_pairs:
+        return all_matched, all_symbols
     count_all = 0
     count_wrong = 0
-    for matched in all_matched:
-        for pair in matched:
-            print(*map(show_event, pair))
+    for matched, symbols in zip(all_matched, all_symbols):
+        for pair, symbol in zip(matched, symbols):
+            print(show_event(pair[0]), show_event(pair[1], symbol))
         print((str.translate(show_event(None), str.maketrans({' ': '-', '|': '+'})) + "-") * 2)
 
     print("Unmatched: ", end="")
@@ -258,10 +568,16 @@ def match_two_sorted(gold, other, max_gap_size=None, max_unmatched=None):
         except StopIteration:
             break
     print()
+    if stats is not None:
+        stats.time("output", time.perf_counter() - start)
+
+    return all_matched, all_symbols
 
-    return all_matched
+# The events of an alignment in order and a symbol for every event: None if the other event was matched,
+# "+" for a gold event added, "-" for an other event removed. The events themselves are not changed.
+MarkedEvents = namedtuple("MarkedEvents", ["events", "symbols"])
 
-def match_levenshtein(gold, other):
+def _match_levenshtein_table(gold, other):
     class Action(Enum):
         MATCH = 1
         REMOVE = 2
@@ -286,25 +602,237 @@ def match_levenshtein(gold, other):
                 distances[i][j] = (1 + distances[i][j - 1][0], Action.REMOVE)
     
     result = []
+    symbols = []
 
     pos = (len(gold) - 1, len(other) - 1)
     while pos != (0, 0):
         dist, action = distances[pos[0]][pos[1]]
         if action == Action.MATCH:
             result.append(other[pos[1]])
+            symbols.append(None)
             pos = (pos[0] - 1, pos[1] - 1)
         elif action == Action.REMOVE:
-            event = copy(other[pos[1]])
-            event.symbol = "-"
-            result.append(event)
+            result.append(other[pos[1]])
+            symbols.append("-")
             pos = (pos[0], pos[1] - 1)
         elif action == Action.ADD:
-            event = copy(gold[pos[0]])
-            event.symbol = "+"
-            result.append(event)
+            result.append(gold[pos[0]])
+            symbols.append("+")
             pos = (pos[0] - 1, pos[1])
     
-    return reversed(result)
+    result.reverse()
+    symbols.reverse()
+    return MarkedEvents(result, symbols)
+
+def _lcs_next_row(row, key, other_keys):
+    # One row of the LCS table over other_keys[:len(row)], computed from the previous one.
+    # Column 0 is the boundary (first events are never compared, same as the table engine).
+    result = row.copy()
+    diagonal = np.where(other_keys[1:len(row)] == key, row[:-1] + 1, 0)
+    np.maximum(result[1:], diagonal, out=result[1:])
+    np.maximum.accumulate(result, out=result)
+    return result
+
+LINEAR_BLOCK_CELLS = 1 << 20
+
+# (gold index, other index) pairs of the alignment of the linear engine in order, -1 where an event of the other
+# track is left out: (i, j) matched, (i, -1) gold event added ("+"), (-1, j) other event removed ("-").
+# stats (an instrumentation.MatchStats) counts the table cells computed (levenshtein_cells).
+def levenshtein_path(gold, other, stats=None):
+    # Same distances and backtrace rules as the table engine, but only O(len(other) * log(len(gold)))
+    # cells are kept at a time. Rows are recomputed Hirschberg-style: the backtrace path of the upper half
+    # of a row range is traced first, which tells us where it enters the lower half.
+    if len(gold) == 0 or len(other) == 0:
+        return []
+    gold_keys = event_keys(gold)
+    other_keys = event_keys(other)
+    result = []
+    cells = [0]
+
+    def walk(lo, rows, j):
+        i = lo + len(rows) - 2
+        while i >= lo:
+            if j == 0:
+                result.append((i, -1))
+                i -= 1
+            elif gold_keys[i] == other_keys[j]:
+                result.append((i, j))
+                i -= 1
+                j -= 1
+            elif rows[i - lo][j] > rows[i - lo + 1][j - 1]:
+                result.append((i, -1))
+                i -= 1
+            else:
+                result.append((-1, j))
+                j -= 1
+        return j
+
+    # Traces the path from (hi, j) until it leaves row lo, returns the column where it enters row lo - 1.
+    # prev is the LCS row lo - 1.
+    def trace(lo, hi, prev, j):
+        prev = prev[:j + 1]
+        if (hi - lo + 1) * (j + 1) <= LINEAR_BLOCK_CELLS or hi == lo:
+            rows = [prev]
+            for i in range(lo, hi + 1):
+                rows.append(_lcs_next_row(rows[-1], gold_keys[i], other_keys))
+            cells[0] += (hi - lo + 1) * j
+            return walk(lo, rows, j)
+        mid = (lo + hi) // 2
+        row = prev
+        for i in range(lo, mid + 1):
+            row = _lcs_next_row(row, gold_keys[i], other_keys)
+        cells[0] += (mid - lo + 1) * j
+        j = trace(mid + 1, hi, row, j)
+        return trace(lo, mid, prev, j)
+
+    j = len(other) - 1
+    if len(gold) > 1:
+        j = trace(1, len(gold) - 1, np.zeros(len(other), dtype=np.int32), j)
+    result.extend((-1, j) for j in range(j, 0, -1))
+
+    result.reverse()
+    if stats is not None:
+        stats.count("levenshtein_cells", cells[0])
+    return result
+
+def _match_levenshtein_linear(gold, other, stats=None):
+    result = []
+    symbols = []
+    for i, j in levenshtein_path(gold, other, stats):
+        if i < 0:
+            result.append(other[j])
+            symbols.append("-")
+        elif j < 0:
+            result.append(gold[i])
+            symbols.append("+")
+        else:
+            result.append(other[j])
+            symbols.append(None)
+    return MarkedEvents(result, symbols)
+
+# Returns MarkedEvents. stats (an instrumentation.MatchStats) gets the time spent matching and the cells the
+# linear engine computes (levenshtein_cells).
+def match_levenshtein(gold, other, engine="linear", stats=None):
+    start = time.perf_counter()
+    if engine == "linear":
+        result = _match_levenshtein_linear(gold, other, stats)
+    elif engine == "table":
+        result = _match_levenshtein_table(gold, other)
+    else:
+        raise ValueError("Unknown engine {}.".format(engine))
+    if stats is not None:
+        stats.time("match", time.perf_counter() - start)
+    return result
+
+# Number of events to add and remove (the edits match_levenshtein counts) to turn gold into other, comparing
+# every event (match_levenshtein never compares the first ones). Nothing is aligned, only the distance is
+# computed: rows of the LCS table are bit vectors in Python ints (bit-parallel LCS), a row costs a few
+# operations on len(other) / 64 machine words. With max_distance it returns None as soon as the distance is
+# known to be larger: when the lengths differ by more, or when even matching all remaining gold events
+# could not bring it down to max_distance (checked every 16 rows).
+def levenshtein_distance(gold, other, max_distance=None):
+    gold_keys, other_keys = event_keys(gold), event_keys(other)
+    n, m = len(gold_keys), len(other_keys)
+    if max_distance is not None and abs(n - m) > max_distance:
+        return None
+    masks = {} # key -> bits of the positions of other with that key
+    for key in np.unique(other_keys).tolist():
+        masks[key] = int.from_bytes(np.packbits(other_keys == key, bitorder="little").tobytes(), "little")
+    all_bits = (1 << m) - 1
+    row = all_bits # a 0 bit is where the LCS of the row grows
+    for i, key in enumerate(gold_keys.tolist()):
+        matches = row & masks.get(key, 0)
+        row = ((row + matches) | (row - matches)) & all_bits
+        if max_distance is not None and i % 16 == 15: # the bound only changes slowly
+            longest = min(m - row.bit_count() + n - i - 1, m)
+            if n + m - 2 * longest > max_distance:
+                return None
+    distance = n + m - 2 * (m - row.bit_count())
+    if max_distance is not None and distance > max_distance:
+        return None
+    return distance
+
+BandedAlignment = namedtuple("BandedAlignment", ["events", "symbols", "cells", "full_cells"])
+
+def _tempo_band(scaled_gold_times, other_times, band_width):
+    # For every gold prefix length i the range of other prefix lengths explored in the DP. The band follows
+    # the straight tempo path given by gold times scaled to other's duration.
+    centers = np.concatenate(([0], np.searchsorted(other_times, scaled_gold_times, side="right")))
+    lo = np.maximum.accumulate(np.maximum(centers - band_width, 0))
+    hi = np.maximum.accumulate(np.minimum(centers + band_width, len(other_times)))
+    lo[0] = 0
+    hi[-1] = len(other_times)
+    lo[1:] = np.minimum(lo[1:], hi[:-1]) # keep the band connected
+    return lo, np.maximum(hi, lo)
+
+def match_banded(gold, other, band_width=32, time_tolerance=None):
+    # Dynamic time warping style alignment restricted to a Sakoe-Chiba band of band_width events around
+    # the expected tempo path. Similar events may be matched, all other events are added/removed at cost 1.
+    # A match costs between 0 and 1 depending on how far the events are from each other after scaling
+    # gold times to other times, time_tolerance is the distance (in other's time units) for cost 1/2.
+    # Returns the same events and symbols as match_levenshtein together with the number of DP cells
+    # evaluated and the size of the full matrix.
+    MATCH, ADD, REMOVE = 0, 1, 2
+    n, m = len(gold), len(other)
+    if n == 0 or m == 0:
+        # Nothing to match, all gold events are added or all other events removed.
+        events, symbol = (gold, "+") if m == 0 else (other, "-")
+        return BandedAlignment(list(events), [symbol] * len(events), 0, (n + 1) * (m + 1))
+    gold_keys, other_keys = event_keys(gold), event_keys(other)
+    gold_times, other_times = event_times(gold), event_times(other)
+    gold_duration = gold_times[-1] - gold_times[0]
+    ratio = (other_times[-1] - other_times[0]) / gold_duration if gold_duration > 0 else 1.0
+    scaled_gold_times = other_times[0] + (gold_times - gold_times[0]) * ratio
+    if time_tolerance is None:
+        time_tolerance = max((other_times[-1] - other_times[0]) / m, 1.0)
+
+    lo, hi = _tempo_band(scaled_gold_times, other_times, band_width)
+    actions = [np.full(hi[0] + 1, REMOVE, dtype=np.int8)]
+    prev = np.arange(hi[0] + 1, dtype=np.float64)
+    for i in range(1, n + 1):
+        columns = np.arange(lo[i], hi[i] + 1)
+        up = np.full(len(columns), INF)
+        inside = (columns >= lo[i - 1]) & (columns <= hi[i - 1])
+        up[inside] = prev[columns[inside] - lo[i - 1]] + 1
+        diagonal = np.full(len(columns), INF)
+        inside = (columns >= lo[i - 1] + 1) & (columns <= hi[i - 1] + 1)
+        inside[inside] = other_keys[columns[inside] - 1] == gold_keys[i - 1]
+        deviation = np.abs(other_times[columns[inside] - 1] - scaled_gold_times[i - 1])
+        diagonal[inside] = prev[columns[inside] - 1 - lo[i - 1]] + deviation / (deviation + time_tolerance)
+        best = np.minimum(up, diagonal)
+        row = np.minimum.accumulate(best - columns) + columns
+        action = np.where(diagonal <= up, MATCH, ADD).astype(np.int8)
+        # Removing is only better if the left neighbour + 1 beats the cell by more than the rounding of the
+        # accumulated costs, so the first column of the band (without a left neighbour) is never REMOVE.
+        remove = np.zeros(len(columns), dtype=bool)
+        remove[1:] = row[:-1] + 1 < best[1:] - 1e-9
+        action[remove] = REMOVE
+        row = np.where(remove, row, best)
+        actions.append(action)
+        prev = row
+
+    result = []
+    symbols = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        action = actions[i][j - lo[i]]
+        if action == MATCH:
+            result.append(other[j - 1])
+            symbols.append(None)
+            i, j = i - 1, j - 1
+        elif action == ADD:
+            result.append(gold[i - 1])
+            symbols.append("+")
+            i -= 1
+        else:
+            result.append(other[j - 1])
+            symbols.append("-")
+            j -= 1
+
+    result.reverse()
+    symbols.reverse()
+    cells = int(np.sum(hi - lo + 1))
+    return BandedAlignment(result, symbols, cells, (n + 1) * (m + 1))
 
 if __name__ == '__main__':
     # Chopin -> track 1
@@ -319,12 +847,14 @@ if __name__ == '__main__':
             "../data/match_midi/{}_p{:0>2}.mid".format(base_name, recording)
         ]
     print(filenames)
-    tracks = [preprocess(midi.read_midifile(filename)[0]) for filename in filenames]
+    tracks = [read_track(filename) for filename in filenames]
 #    for group in group_events(tracks[0]): print(*map(show_event, group))
 #    for event in preprocess(midi.read_midifile("../data/midi/Schubert_D783_no15_p22.mid")):
 #        print(event)
-#    print("\n".join(map(show_event, match_levenshtein(tracks[0], tracks[1]))))
-#    match(tracks[0], tracks[1:], print_unmatched=False, sort_by=1, max_gap_size=15)
-    all_matched = match_two_sorted(tracks[0], tracks[1], max_gap_size=10, max_unmatched=20)
+#    print("\n".join(map(show_event, *match_levenshtein(tracks[0], tracks[1]))))
+#    match(tracks[0], tracks[1:], print_unmatched=False, sort_by=1, max_gap_size=15, print_pairs=True)
+#    banded = match_banded(tracks[0], tracks[1], band_width=32)
+#    print("\n".join(map(show_event, *banded[:2])), "\ncells: {} / {}".format(banded.cells, banded.full_cells))
+    all_matched, _ = match_two_sorted(tracks[0], tracks[1], max_gap_size=10, max_unmatched=20, print_pairs=True)
     aligned_gold = [g for g, _ in sum(all_matched, []) if g is not None]
-    print("\n".join(map(show_event, match_levenshtein(aligned_gold, tracks[1]))))
+    print("\n".join(map(show_event, *match_levenshtein(aligned_gold, tracks[1]))))
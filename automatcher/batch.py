@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+
+import json, os, re, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import lru_cache
+from automatcher import read_track, events_from_match, group_events, match_two_sorted, match_levenshtein, show_event
+from cache import TrackCache
+from anchored import match_anchored
+from alignment import WRITERS, align_levenshtein, align_sorted
+from instrumentation import MatchStats, phase
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "match_to_midi"))
+from match_to_midi import MatchFile
+
+METHODS = ("sorted", "levenshtein", "both", "anchored")
+FORMATS = ("text",) + tuple(WRITERS)
+
+# (score, performance) file pairs of a corpus. Performances are <piece>_pNN.mid with the score in
+# <piece>_score.mid, or <piece>_pNN.match where the score notes are taken from the first match file of
+# the piece (like generate_data.sh does).
+def corpus_pairs(corpus_dir):
+    names = sorted(os.listdir(corpus_dir))
+    match_scores = {}
+    for name in names:
+        found = re.match(r"(.*)_p\d+\.(mid|match)$", name)
+        if found is None:
+            continue
+        piece, extension = found.groups()
+        if extension == "match":
+            score_name = match_scores.setdefault(piece, name)
+        else:
+            score_name = piece + "_score.mid"
+            if score_name not in names:
+                continue
+        yield os.path.join(corpus_dir, score_name), os.path.join(corpus_dir, name)
+
+# Preprocessed events of a .mid file, or of the score or played notes of a .match file. With an enabled
+# TrackCache it is a columnar Track loaded from (or added to) the cache, with columnar a columnar Track too.
+def load_track(filename, score_notes=False, cache=None, columnar=False):
+    if cache is not None and cache.enabled:
+        return cache.track(filename, score_notes)
+    if filename.endswith(".match"):
+        return events_from_match(MatchFile(filename, fast=True, lazy=True), score_notes, columnar=columnar)
+    return read_track(filename, columnar)
+
+# Cached per worker process, so every score is parsed and preprocessed at most once per worker. The key
+# includes cache, align_corpus sets one TrackCache per worker (not per job) so that it is the same object.
+@lru_cache(maxsize=8)
+def load_score(filename, cache=None):
+    return load_track(filename, score_notes=True, cache=cache)
+
+# Alignment of a pair with method "sorted", "levenshtein" or "both".
+def align_structured(gold, other, method="sorted", max_gap_size=10, max_unmatched=20, chord_tolerance=None,
+        stats=None):
+    if method == "levenshtein":
+        return align_levenshtein(gold, other, stats)
+    alignment = align_sorted(gold, other, max_gap_size, max_unmatched, chord_tolerance, stats)
+    if method == "both":
+        gold = [gold[i] for i in alignment.score_index.tolist() if i >= 0]
+        alignment = align_levenshtein(gold, other, stats)
+    return alignment
+
+# chord_tolerance groups score events that are at most that many ticks apart into one chord. Formats other
+# than "text" (what automatcher.py prints) write an Alignment with one of the WRITERS. With instrument the
+# counters and phase times of the pair are returned too (MatchStats.as_dict()), otherwise None.
+def align_pair(score_file, performance_file, output_dir, method="sorted", max_gap_size=10, max_unmatched=20,
+        cache=None, chord_tolerance=None, output_format="text", instrument=False):
+    start = time.perf_counter()
+    stats = MatchStats() if instrument else None
+    with phase(stats, "preprocess"): # reading and preprocessing the tracks (load_track), grouping chords below
+        gold = load_score(score_file, cache)
+        other = load_track(performance_file, cache=cache, columnar=output_format != "text") # Tracks keep velocities
+    name = os.path.splitext(os.path.basename(performance_file))[0]
+    if output_format != "text":
+        with phase(stats, "match"):
+            alignment = align_structured(gold, other, method, max_gap_size, max_unmatched, chord_tolerance, stats)
+        with phase(stats, "output"):
+            WRITERS[output_format](alignment, os.path.join(output_dir, "{}.{}.{}".format(name, method, output_format)))
+        return name, len(gold) + len(other), time.perf_counter() - start, stats and stats.as_dict()
+    output_file = os.path.join(output_dir, "{}.{}.txt".format(name, method))
+    with open(output_file, "w") as output:
+        with phase(stats, "preprocess"):
+            if method == "both":
+                other = list(other) # match_levenshtein reads the Events match_two_sorted marked, not new ones
+            gold_groups = group_events(gold, chord_tolerance) if chord_tolerance is not None else None
+        if method in ("sorted", "both"):
+            with redirect_stdout(output): # match_two_sorted times its matching and printing
+                all_matched, _ = match_two_sorted(gold, other, max_gap_size=max_gap_size, max_unmatched=max_unmatched,
+                        gold_groups=gold_groups, stats=stats, print_pairs=True)
+            if method == "both": # same as __main__ of automatcher.py
+                gold = [g for g, _ in sum(all_matched, []) if g is not None]
+        if method in ("levenshtein", "both"):
+            events = match_levenshtein(gold, other, stats=stats)
+            with phase(stats, "output"):
+                output.write("\n".join(map(show_event, *events)))
+                output.write("\n")
+        if method == "anchored": # pairs are already aligned in parallel, segments are not
+            with phase(stats, "match"):
+                events = match_anchored(gold, other, workers=1)
+            with phase(stats, "output"):
+                output.write("\n".join(map(show_event, *events)))
+                output.write("\n")
+    return name, len(gold) + len(other), time.perf_counter() - start, stats and stats.as_dict()
+
+_worker_cache = None
+
+def _set_worker_cache(cache):
+    global _worker_cache
+    _worker_cache = cache
+
+def _align_pair(arguments):
+    # The TrackCache is sent once per worker, jobs do not carry it.
+    *pair, chord_tolerance, output_format, instrument = arguments
+    return align_pair(*pair, _worker_cache, chord_tolerance, output_format, instrument)
+
+def align_corpus(corpus_dir, output_dir, method="sorted", max_gap_size=10, max_unmatched=20, workers=None, verbose=True,
+        cache=None, chord_tolerance=None, output_format="text", stats=None):
+    if output_format != "text" and method == "anchored":
+        raise ValueError("Method anchored only writes text.")
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(score_file, performance_file, output_dir, method, max_gap_size, max_unmatched, chord_tolerance,
+            output_format, stats is not None)
+            for score_file, performance_file in corpus_pairs(corpus_dir)]
+    start = time.perf_counter()
+    notes = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_cache, initargs=(cache,)) as executor:
+        # pairs are sorted by piece, chunks keep pairs of the same score on the same worker
+        chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+        for name, pair_notes, elapsed, pair_stats in executor.map(_align_pair, jobs, chunksize=chunksize):
+            notes += pair_notes
+            if stats is not None:
+                stats.merge(pair_stats)
+            if verbose:
+                print("{:<30} {:>6} notes {:.3f}s".format(name, pair_notes, elapsed))
+    elapsed = time.perf_counter() - start
+    print("{} pairs, {} notes in {:.3f}s: {:.2f} pairs/s, {:.0f} notes/s".format(
+        len(jobs), notes, elapsed, len(jobs) / elapsed, notes / elapsed))
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Aligns every <piece>_pNN.mid in a corpus with its <piece>_score.mid, '
+                        'or the played notes of every <piece>_pNN.match with the score notes of the piece.')
+    parser.add_argument('corpus_dir', type=str, nargs='?', default="../data/match_midi",
+                        help='directory with <piece>_score.mid and <piece>_pNN.mid files or <piece>_pNN.match files')
+    parser.add_argument('output_dir', type=str, nargs='?', default="../data/alignments",
+                        help='directory for the per-pair alignments')
+    parser.add_argument('--method', '-m', dest='method', default='sorted', choices=METHODS,
+                        help='"both" aligns with match_two_sorted and then with match_levenshtein like automatcher.py does, '
+                        '"anchored" with match_levenshtein between anchors')
+    parser.add_argument('--workers', '-w', dest='workers', type=int, default=None,
+                        help='number of worker processes, number of CPUs by default')
+    parser.add_argument('--max-gap-size', '-g', dest='max_gap_size', type=int, default=10)
+    parser.add_argument('--max-unmatched', '-u', dest='max_unmatched', type=int, default=20)
+    parser.add_argument('--chord-tolerance', '-t', dest='chord_tolerance', type=int, default=None,
+                        help='score events at most this many ticks apart are one chord, by default only events at the same tick')
+    parser.add_argument('--format', '-f', dest='output_format', default='text', choices=FORMATS,
+                        help='"text" like automatcher.py prints, or a structured alignment as csv, jsonl or match '
+                        '(a .match file MatchFile reads), not for "anchored"')
+    parser.add_argument('--stats', '-s', dest='stats_file', type=str, default=None,
+                        help='counts what the matchers do and times the phases of every pair, prints a summary and '
+                        'writes the totals to this JSON file')
+    parser.add_argument('--quiet', '-q', action='store_const',
+                        default = False, const = True,
+                        help='only prints the summary')
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=None,
+                        help='cache of preprocessed tracks, $AUTOMATCHER_CACHE_DIR or ~/.cache/automatcher by default')
+    parser.add_argument('--no-cache', dest='cache', action='store_const',
+                        default = True, const = False,
+                        help='always parses and preprocesses the input files (also AUTOMATCHER_CACHE=0)')
+
+    args = parser.parse_args()
+    cache = TrackCache(args.cache_dir, enabled=None if args.cache else False)
+    stats = MatchStats() if args.stats_file is not None else None
+    align_corpus(args.corpus_dir, args.output_dir, method=args.method, max_gap_size=args.max_gap_size,
+            max_unmatched=args.max_unmatched, workers=args.workers, verbose=not args.quiet, cache=cache,
+            chord_tolerance=args.chord_tolerance, output_format=args.output_format, stats=stats)
+    if stats is not None:
+        print(stats.summary())
+        with open(args.stats_file, "w") as output:
+            json.dump(stats.as_dict(), output, indent=1)
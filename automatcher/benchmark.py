@@ -0,0 +1,347 @@
+#!/usr/bin/python3
+
+import glob, json, os, platform, subprocess, sys, tempfile, time, tracemalloc
+from automatcher import preprocess, read_track, match_levenshtein, levenshtein_distance, show_event
+from batch import corpus_pairs, load_track
+from midifile import read_notes
+try:
+    import midi
+except ImportError:
+    midi = None
+
+MATCH_TO_MIDI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "match_to_midi", "match_to_midi.py")
+
+# Peak is None with traced=False, the time is then not slowed down by tracemalloc.
+def measure(function, *args, traced=True):
+    if traced:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if traced:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+def bench_levenshtein(corpus_dir, engines, check=False, limit=None):
+    tracks = {}
+    def load(filename):
+        if filename not in tracks:
+            tracks[filename] = read_track(filename)
+        return tracks[filename]
+
+    totals = {engine: [0.0, 0] for engine in engines}
+    for n, (score_file, performance_file) in enumerate(corpus_pairs(corpus_dir)):
+        if limit is not None and n >= limit:
+            break
+        gold, other = load(score_file), load(performance_file)
+        results = []
+        line = [os.path.basename(performance_file), len(gold), len(other)]
+        for engine in engines:
+            events, elapsed, peak = measure(lambda: match_levenshtein(gold, other, engine))
+            results.append(list(map(show_event, *events)))
+            totals[engine][0] += elapsed
+            totals[engine][1] = max(totals[engine][1], peak)
+            line += ["{}: {:.3f}s {:.1f}MiB".format(engine, elapsed, peak / 2**20)]
+        if check and any(result != results[0] for result in results):
+            line.append("MISMATCH")
+        print(*line)
+
+    for engine, (elapsed, peak) in totals.items():
+        print("{:<6} total {:.3f}s, peak {:.1f}MiB".format(engine, elapsed, peak / 2**20))
+
+def bench_distance(corpus_dir, max_distance=None, limit=None):
+    # Full match_levenshtein versus levenshtein_distance, with and without max_distance. Every performance is
+    # also checked against the score of another piece, the check a mislabeled file would fail.
+    pairs = list(corpus_pairs(corpus_dir))[:limit]
+    scores = {score_file: read_track(score_file, columnar=True) for score_file, _ in pairs}
+    totals = [0.0, 0.0, 0.0]
+    within = wrong_within = 0
+    for score_file, performance_file in pairs:
+        gold, other = scores[score_file], read_track(performance_file, columnar=True)
+        wrong_file = next((name for name in scores if name != score_file), score_file)
+        _, full_elapsed, _ = measure(lambda: match_levenshtein(gold, other), traced=False)
+        distance, elapsed, _ = measure(levenshtein_distance, gold, other, traced=False)
+        bounded, bounded_elapsed, _ = measure(levenshtein_distance, gold, other, max_distance, traced=False)
+        wrong, wrong_elapsed, _ = measure(levenshtein_distance, scores[wrong_file], other, max_distance, traced=False)
+        totals[0] += full_elapsed
+        totals[1] += elapsed
+        totals[2] += bounded_elapsed + wrong_elapsed
+        within += bounded is not None
+        wrong_within += wrong is not None
+        print("{:<30} distance {:>5} full {:.4f}s distance {:.4f}s bounded {:.4f}s {} other score {:.4f}s {}".format(
+            os.path.basename(performance_file), distance, full_elapsed, elapsed, bounded_elapsed,
+            "within" if bounded is not None else "over", wrong_elapsed, "within" if wrong is not None else "over"))
+    print("match_levenshtein {:.3f}s, levenshtein_distance {:.3f}s, bounded (both checks) {:.3f}s".format(*totals))
+    print("{} of {} pairs within {}, {} with the score of another piece".format(within, len(pairs), max_distance,
+        wrong_within))
+
+def bench_tracks(corpus_dir, limit=None):
+    # Memory needed to load preprocessed tracks (read_track) as Event lists and as columnar Tracks.
+    filenames = sorted(os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir) if name.endswith(".mid"))
+    filenames = filenames[:limit]
+    for columnar in (False, True):
+        tracks, elapsed, peak = measure(lambda: [read_track(filename, columnar) for filename in filenames])
+        notes = sum(map(len, tracks))
+        print("{:<8} {} notes, {:.3f}s, {:.1f}MiB, {:.0f} B/note".format(
+            "columnar" if columnar else "events", notes, elapsed, peak / 2**20, peak / max(notes, 1)))
+
+def bench_midi(corpus_dir, limit=None):
+    # Loading .mid files with python-midi and preprocess (if installed) versus read_track.
+    filenames = sorted(os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir) if name.endswith(".mid"))
+    filenames = filenames[:limit]
+    loaders = [
+        ("python-midi", lambda: [preprocess(midi.read_midifile(filename)[0]) for filename in filenames]),
+        ("reader", lambda: [read_track(filename) for filename in filenames]),
+        ("columnar", lambda: [read_track(filename, columnar=True) for filename in filenames])
+    ]
+    if midi is None:
+        print("python-midi skipped, it is not installed")
+        loaders = loaders[1:]
+    results = []
+    for name, loader in loaders:
+        tracks, elapsed, peak = measure(loader)
+        results.append([list(map(show_event, track)) for track in tracks])
+        notes = sum(map(len, tracks))
+        print("{:<11} {} files, {} notes in {:.3f}s: {:.0f} notes/s, peak {:.1f}MiB".format(
+            name, len(filenames), notes, elapsed, notes / elapsed, peak / 2**20))
+    if any(result != results[0] for result in results):
+        print("EVENTS DIFFER")
+
+def bench_pipeline(match_dir, limit=None):
+    # .match -> events through match_to_midi.py processes and .mid files (like generate_data.sh) versus directly
+    from match_to_midi import MatchFile
+    filenames = sorted(glob.glob(os.path.join(match_dir, "*.match")))[:limit]
+    jobs = [(filename, score_notes) for filename in filenames for score_notes in (True, False)]
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        script_tracks = []
+        for n, (filename, score_notes) in enumerate(jobs):
+            scaling = MatchFile(filename, lazy=True).default_time_scaling(score_notes)
+            output_file = os.path.join(output_dir, "{}.mid".format(n))
+            subprocess.run([sys.executable, MATCH_TO_MIDI, "-n", "score" if score_notes else "played",
+                    "-s", str(scaling), filename, output_file], check=True)
+            script_tracks.append(read_track(output_file))
+        script_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    direct_tracks = [load_track(filename, score_notes) for filename, score_notes in jobs]
+    direct_elapsed = time.perf_counter() - start
+    notes = sum(map(len, direct_tracks))
+    same = all(list(map(show_event, a)) == list(map(show_event, b)) for a, b in zip(script_tracks, direct_tracks))
+    print("script {:.3f}s, direct {:.3f}s, {} tracks, {} events, speedup {:.1f}x, {}".format(script_elapsed,
+        direct_elapsed, len(jobs), notes, script_elapsed / direct_elapsed, "same events" if same else "EVENTS DIFFER"))
+
+SUITE_STAGES = ("parse", "parse_fast", "get_pattern", "write_events", "preprocess", "read_track", "find_matching",
+        "find_matching_sorted", "match_levenshtein")
+MATCHER_STAGES = SUITE_STAGES[-3:]
+
+def _note_track(filename):
+    # Index of the first track with notes, performances in data/midi have them in track 0 or 1.
+    track_index = 0
+    while True:
+        try:
+            if len(read_notes(filename, track_index).pitch):
+                return track_index
+        except IndexError:
+            return 0
+        track_index += 1
+
+def _git_commit():
+    try:
+        found = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True)
+    except OSError:
+        return None
+    return found.stdout.strip() or None
+
+# Times every stage file by file (pair by pair for the matchers) and writes the results as JSON: a record
+# per file and stage, totals per stage, and for the matchers their accuracy against the pairs of the .match
+# files. notes are the note events (NoteOn and NoteOff) of a file or pair, like batch.py counts them. With
+# memory every file is run a second time under tracemalloc for its peak memory, times come from the first run.
+def bench_suite(match_dir, midi_dir, corpus_dir, output_file=None, stages=SUITE_STAGES, limit=None, memory=True,
+        max_gap_size=10, max_unmatched=20):
+    from match_to_midi import MatchFile
+    from alignment import align_levenshtein, align_sorted, align_unsorted
+    from evaluation import accuracy, ground_truth, pair_match_files, total_accuracy
+    records = []
+    def run(stage, name, notes, function, *args):
+        result, elapsed, _ = measure(function, *args, traced=False)
+        peak = measure(function, *args)[2] if memory else None
+        records.append({"stage": stage, "file": name, "notes": notes, "seconds": elapsed, "peak_bytes": peak})
+        return result
+
+    match_files = sorted(glob.glob(os.path.join(match_dir, "*.match")))[:limit]
+    for fast, stage in ((False, "parse"), (True, "parse_fast")):
+        if stage in stages:
+            for filename in match_files:
+                match_file = run(stage, os.path.basename(filename), 0, MatchFile, filename, fast)
+                records[-1]["notes"] = 2 * sum(note is not None for notes in match_file.matches for note in notes)
+    if "get_pattern" in stages and midi is None:
+        print("get_pattern skipped, python-midi is not installed")
+    elif "get_pattern" in stages:
+        def write_pattern(match_file, output_file):
+            midi.write_midifile(output_file, match_file.get_pattern(match_file.default_time_scaling(False), False))
+        with tempfile.TemporaryDirectory() as output_dir:
+            for filename in match_files:
+                match_file = MatchFile(filename, fast=True)
+                notes = 2 * sum(1 for _ in match_file.played_notes)
+                run("get_pattern", os.path.basename(filename), notes, write_pattern, match_file,
+                        os.path.join(output_dir, "pattern.mid"))
+    if "write_events" in stages:
+        from match_to_midi import write_event_arrays
+        def write_events(match_file, output_file):
+            write_event_arrays(output_file, match_file.get_event_arrays(match_file.default_time_scaling(False), False),
+                    int(match_file.info['midiClockUnits']))
+        with tempfile.TemporaryDirectory() as output_dir:
+            for filename in match_files:
+                match_file = MatchFile(filename, fast=True)
+                notes = 2 * sum(1 for _ in match_file.played_notes)
+                run("write_events", os.path.basename(filename), notes, write_events, match_file,
+                        os.path.join(output_dir, "events.mid"))
+    midi_files = sorted(glob.glob(os.path.join(midi_dir, "*.mid")))[:limit]
+    if "preprocess" in stages and midi is None:
+        print("preprocess skipped, python-midi is not installed")
+    elif "preprocess" in stages:
+        def load_preprocessed(filename, track_index):
+            return preprocess(midi.read_midifile(filename)[track_index])
+        for filename in midi_files:
+            track = run("preprocess", os.path.basename(filename), 0, load_preprocessed, filename, _note_track(filename))
+            records[-1]["notes"] = len(track)
+    if "read_track" in stages:
+        for filename in midi_files:
+            track = run("read_track", os.path.basename(filename), 0, read_track, filename, False, _note_track(filename))
+            records[-1]["notes"] = len(track)
+
+    aligners = {
+        "find_matching": lambda gold, other: align_unsorted(gold, other, max_gap_size, max_unmatched),
+        "find_matching_sorted": lambda gold, other: align_sorted(gold, other, max_gap_size, max_unmatched),
+        "match_levenshtein": align_levenshtein
+    }
+    aligners = {stage: aligner for stage, aligner in aligners.items() if stage in stages}
+    scores = {}
+    for score_file, performance_file in list(corpus_pairs(corpus_dir))[:limit] if aligners else ():
+        if score_file not in scores:
+            scores[score_file] = read_track(score_file)
+        gold, other = scores[score_file], read_track(performance_file)
+        score_match, performance_match = pair_match_files(match_dir, score_file, performance_file)
+        truth = ground_truth(MatchFile(score_match, fast=True, lazy=True), MatchFile(performance_match, fast=True, lazy=True))
+        for stage, aligner in aligners.items():
+            alignment = run(stage, os.path.basename(performance_file), len(gold) + len(other), aligner, gold, other)
+            records[-1]["accuracy"] = accuracy(alignment, truth)
+
+    totals = {}
+    for stage in stages:
+        stage_records = [record for record in records if record["stage"] == stage]
+        if not stage_records:
+            continue
+        notes = sum(record["notes"] for record in stage_records)
+        seconds = sum(record["seconds"] for record in stage_records)
+        totals[stage] = {"files": len(stage_records), "notes": notes, "seconds": seconds,
+                "notes_per_second": notes / seconds if seconds else None,
+                "peak_bytes": max(record["peak_bytes"] for record in stage_records) if memory else None}
+        if stage in MATCHER_STAGES:
+            totals[stage]["accuracy"] = total_accuracy([record["accuracy"] for record in stage_records])
+    print_totals(totals)
+    results = {"commit": _git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "parameters": {"max_gap_size": max_gap_size, "max_unmatched": max_unmatched, "limit": limit},
+            "stages": totals, "files": records}
+    if output_file is not None:
+        with open(output_file, "w") as output:
+            json.dump(results, output, indent=1)
+    return results
+
+def print_totals(totals):
+    for stage, total in totals.items():
+        line = "{:<20} {:>4} files {:>8} notes {:>8.3f}s {:>9.0f} notes/s".format(stage, total["files"],
+                total["notes"], total["seconds"], total["notes_per_second"] or 0)
+        if total["peak_bytes"] is not None:
+            line += " peak {:>6.1f}MiB".format(total["peak_bytes"] / 2**20)
+        if "accuracy" in total:
+            line += " precision {precision:.4f} recall {recall:.4f} f1 {f1:.4f}".format(**total["accuracy"])
+        print(line)
+
+# Stage totals of two bench_suite result files side by side, times as new / old.
+def compare_results(old_file, new_file):
+    with open(old_file) as old_input, open(new_file) as new_input:
+        old, new = json.load(old_input), json.load(new_input)
+    print("{} -> {}".format((old["commit"] or old_file)[:12], (new["commit"] or new_file)[:12]))
+    for stage, total in new["stages"].items():
+        if stage not in old["stages"]:
+            continue
+        old_total = old["stages"][stage]
+        line = "{:<20} {:>8.3f}s -> {:>8.3f}s ({:.2f}x)".format(stage, old_total["seconds"], total["seconds"],
+                total["seconds"] / old_total["seconds"] if old_total["seconds"] else 0)
+        if total["peak_bytes"] is not None and old_total["peak_bytes"] is not None:
+            line += " peak {:.1f} -> {:.1f}MiB".format(old_total["peak_bytes"] / 2**20, total["peak_bytes"] / 2**20)
+        if "accuracy" in total and "accuracy" in old_total:
+            line += " f1 {:.4f} -> {:.4f}".format(old_total["accuracy"]["f1"], total["accuracy"]["f1"])
+        print(line)
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks the automatcher over a corpus of score/performance .mid files.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    levenshtein_parser = subparsers.add_parser('levenshtein', help='compares match_levenshtein engines')
+    tracks_parser = subparsers.add_parser('tracks', help='compares memory of Event lists and columnar Tracks')
+    distance_parser = subparsers.add_parser('distance', help='compares match_levenshtein and levenshtein_distance')
+    distance_parser.add_argument('--max-distance', '-k', dest='max_distance', type=int, default=None,
+                        help='maximum distance of the bounded checks')
+    midi_parser = subparsers.add_parser('midi', help='compares python-midi and the built-in reader')
+    pipeline_parser = subparsers.add_parser('pipeline', help='compares .match -> events through .mid files and directly')
+    pipeline_parser.add_argument('match_dir', type=str, nargs='?', default="../data/match",
+                        help='directory with .match files')
+    pipeline_parser.add_argument('--limit', '-l', dest='limit', type=int, default=None,
+                        help='only benchmark the first LIMIT files')
+    suite_parser = subparsers.add_parser('suite', help='times every stage file by file, with accuracy of the matchers')
+    suite_parser.add_argument('--match-dir', dest='match_dir', type=str, default="../data/match",
+                        help='directory with .match files')
+    suite_parser.add_argument('--midi-dir', dest='midi_dir', type=str, default="../data/midi",
+                        help='directory with performance .mid files')
+    suite_parser.add_argument('--corpus-dir', dest='corpus_dir', type=str, default="../data/match_midi",
+                        help='directory with <piece>_score.mid and <piece>_pNN.mid files made from the .match files')
+    suite_parser.add_argument('--output', '-o', dest='output_file', type=str, default=None,
+                        help='JSON file for the results')
+    suite_parser.add_argument('--stages', '-s', dest='stages', nargs='+', default=list(SUITE_STAGES),
+                        choices=SUITE_STAGES)
+    suite_parser.add_argument('--limit', '-l', dest='limit', type=int, default=None,
+                        help='only benchmark the first LIMIT files/pairs of every stage')
+    suite_parser.add_argument('--no-memory', dest='memory', action='store_const',
+                        default = True, const = False,
+                        help='does not run every file a second time for its peak memory')
+    suite_parser.add_argument('--max-gap-size', '-g', dest='max_gap_size', type=int, default=10)
+    suite_parser.add_argument('--max-unmatched', '-u', dest='max_unmatched', type=int, default=20)
+    compare_parser = subparsers.add_parser('compare', help='compares two JSON results of suite')
+    compare_parser.add_argument('old_file', type=str)
+    compare_parser.add_argument('new_file', type=str)
+    for subparser in (levenshtein_parser, tracks_parser, midi_parser, distance_parser):
+        subparser.add_argument('corpus_dir', type=str, nargs='?', default="../data/match_midi",
+                            help='directory with <piece>_score.mid and <piece>_pNN.mid files')
+        subparser.add_argument('--limit', '-l', dest='limit', type=int, default=None,
+                            help='only benchmark the first LIMIT pairs/files')
+    levenshtein_parser.add_argument('--engines', '-e', dest='engines', nargs='+',
+                        default=['linear', 'table'], choices=['linear', 'table'],
+                        help='engines to compare')
+    levenshtein_parser.add_argument('--check', '-c', action='store_const',
+                        default = False, const = True,
+                        help='verifies that all engines produce the same alignment')
+
+    args = parser.parse_args()
+    if args.command == 'levenshtein':
+        bench_levenshtein(args.corpus_dir, args.engines, check=args.check, limit=args.limit)
+    elif args.command == 'distance':
+        bench_distance(args.corpus_dir, args.max_distance, limit=args.limit)
+    elif args.command == 'tracks':
+        bench_tracks(args.corpus_dir, limit=args.limit)
+    elif args.command == 'midi':
+        bench_midi(args.corpus_dir, limit=args.limit)
+    elif args.command == 'pipeline':
+        bench_pipeline(args.match_dir, limit=args.limit)
+    elif args.command == 'suite':
+        bench_suite(args.match_dir, args.midi_dir, args.corpus_dir, args.output_file, args.stages, limit=args.limit,
+                memory=args.memory, max_gap_size=args.max_gap_size, max_unmatched=args.max_unmatched)
+    elif args.command == 'compare':
+        compare_results(args.old_file, args.new_file)
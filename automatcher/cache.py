@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+
+import hashlib, json, os, sys
+import numpy as np
+from automatcher import Track, read_track, events_from_match
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "match_to_midi"))
+from match_to_midi import MatchFile, MatchTable
+
+# Part of every key, increase it when preprocess, events_from_match or the match file parser change
+# what they return so that old entries are not used anymore.
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "automatcher")
+DEFAULT_MAX_BYTES = 1 << 30
+
+class TrackCache:
+    # On-disk cache of preprocessed tracks (.mid files and the score/played notes of .match files) and of
+    # MatchTables, keyed by the content of the source file. Entries are .npy files loaded memory-mapped,
+    # the least recently used ones are removed when the cache gets bigger than max_bytes.
+    # AUTOMATCHER_CACHE=0 disables it, AUTOMATCHER_CACHE_DIR moves it.
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, enabled=None):
+        if directory is None:
+            directory = os.environ.get("AUTOMATCHER_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if enabled is None:
+            enabled = os.environ.get("AUTOMATCHER_CACHE", "1") != "0"
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._digests = {} # (filename, size, mtime) -> content hash, so a file is hashed once per process
+
+    def digest(self, filename):
+        stat = os.stat(filename)
+        file_id = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self._digests:
+            content_hash = hashlib.sha256()
+            with open(filename, "rb") as source:
+                for block in iter(lambda: source.read(1 << 20), b""):
+                    content_hash.update(block)
+            self._digests[file_id] = content_hash.hexdigest()
+        return self._digests[file_id]
+
+    def key(self, filename, *params):
+        return hashlib.sha256(repr((CACHE_VERSION, self.digest(filename)) + params).encode()).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key[:2], key + extension)
+
+    # (records, header) of an entry or None. Using an entry makes it the most recently used one.
+    def load(self, key):
+        path = self._path(key, ".npy")
+        try:
+            try:
+                records = np.load(path, mmap_mode="r")
+            except ValueError: # empty tracks can not be memory-mapped
+                records = np.load(path)
+            with open(self._path(key, ".json")) as header_file:
+                header = json.load(header_file)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return records, header
+
+    def store(self, key, records, header=None):
+        os.makedirs(os.path.dirname(self._path(key, "")), exist_ok=True)
+        # written under temporary names and renamed, concurrent workers never see half-written entries
+        for extension, write in ((".json", lambda output: output.write(json.dumps(header).encode())),
+                (".npy", lambda output: np.save(output, records))):
+            path = self._path(key, extension)
+            temporary_path = "{}.{}.tmp".format(path, os.getpid())
+            with open(temporary_path, "wb") as output:
+                write(output)
+            os.replace(temporary_path, path)
+        self.evict()
+
+    def entries(self):
+        result = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".npy"):
+                    path = os.path.join(root, name)
+                    header_path = path[:-len(".npy")] + ".json"
+                    try:
+                        stat = os.stat(path)
+                        size = stat.st_size + (os.path.getsize(header_path) if os.path.exists(header_path) else 0)
+                    except OSError:
+                        continue # removed by another process
+                    result.append((stat.st_mtime, size, path, header_path))
+        return result
+
+    def size(self):
+        return sum(size for _, size, _, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, path, header_path in entries:
+            if total <= self.max_bytes:
+                break
+            for remove_path in (path, header_path):
+                try:
+                    os.remove(remove_path)
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        for _, _, path, header_path in self.entries():
+            for remove_path in (path, header_path):
+                try:
+                    os.remove(remove_path)
+                except OSError:
+                    pass
+
+    def match_table(self, filename):
+        if not self.enabled:
+            return MatchFile(filename, fast=True, lazy=True).to_table()
+        key = self.key(filename, "match")
+        entry = self.load(key)
+        if entry is not None:
+            records, header = entry
+            return MatchTable(header["info"], header["meta"], records)
+        table = MatchFile(filename, fast=True, lazy=True).to_table()
+        self.store(key, table.notes, {"info": table.info, "meta": table.meta})
+        return table
+
+    # Columnar preprocessed track of a .mid file, or of the score or played notes of a .match file.
+    def track(self, filename, score_notes=False):
+        is_match = filename.endswith(".match")
+        if not self.enabled:
+            if is_match:
+                return events_from_match(MatchFile(filename, fast=True, lazy=True), score_notes, columnar=True)
+            return read_track(filename, columnar=True)
+        key = self.key(filename, "track", score_notes if is_match else None)
+        entry = self.load(key)
+        if entry is not None:
+            return Track.from_records(entry[0])
+        if is_match:
+            track = events_from_match(self.match_table(filename), score_notes, columnar=True)
+        else:
+            track = read_track(filename, columnar=True)
+        self.store(key, track.to_records())
+        return track
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Shows or clears the cache of preprocessed tracks.')
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=None,
+                        help='cache directory, $AUTOMATCHER_CACHE_DIR or ~/.cache/automatcher by default')
+    parser.add_argument('--clear', action='store_const',
+                        default = False, const = True,
+                        help='removes all entries')
+
+    args = parser.parse_args()
+    cache = TrackCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+    print("{}: {} entries, {:.1f}MiB".format(cache.directory, len(cache.entries()), cache.size() / 2**20))
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+
+import os, re, sys
+from automatcher import NOTE_ON_KIND
+from alignment import MATCH, RECOVERED
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "match_to_midi"))
+from match_to_midi import MatchFile
+
+# Anchor of the score note behind every event of the track match_to_midi writes for a match file (and
+# events_from_match makes), None for played notes without a score note. Events are sorted like get_events
+# sorts them, ties keep the order of the notes in the file.
+def event_anchors(match_file, score_notes=True):
+    events = []
+    for pair, (score_note, played_note) in enumerate(match_file.iter_matches()):
+        note = score_note if score_notes else played_note
+        if note is not None:
+            events.append(note.on_event + (pair,))
+            events.append(note.off_event + (pair,))
+    anchors = [score_note.anchor if score_note is not None else None for score_note, _ in match_file.iter_matches()]
+    return [(anchors[pair], is_off) for _, is_off, _, _, pair in sorted(events)]
+
+# Ground truth of a performance: position of every NoteOn of the performance track -> position of the NoteOn
+# of its score note in the score track. The score track is written from score_match_file (the first match
+# file of the piece for data/match_midi), the performance track from the played notes of performance_match_file.
+def ground_truth(score_match_file, performance_match_file):
+    score_positions = {anchor: i for i, (anchor, is_off) in enumerate(event_anchors(score_match_file))
+            if not is_off}
+    return {j: score_positions[anchor]
+            for j, (anchor, is_off) in enumerate(event_anchors(performance_match_file, score_notes=False))
+            if not is_off and anchor in score_positions}
+
+# .match files of a pair of corpus_pairs in match_dir: <piece>_score.mid comes from the first match file of the
+# piece, <piece>_pNN.mid (or .match) from <piece>_pNN.match.
+def pair_match_files(match_dir, score_file, performance_file):
+    piece = re.sub(r"_(score|p\d+)\.(mid|match)$", "", os.path.basename(score_file))
+    names = sorted(name for name in os.listdir(match_dir) if re.match(re.escape(piece) + r"_p\d+\.match$", name))
+    if not names:
+        raise FileNotFoundError("No match files of {} in {}".format(piece, match_dir))
+    performance_name = os.path.splitext(os.path.basename(performance_file))[0] + ".match"
+    return os.path.join(match_dir, names[0]), os.path.join(match_dir, performance_name)
+
+# NoteOn pairs an alignment matched compared with the ground truth: correct, predicted and expected pairs,
+# precision, recall and their F1 score.
+def accuracy(alignment, truth):
+    columns = alignment.columns()
+    matched = (((columns["op"] == MATCH) | (columns["op"] == RECOVERED)) & (columns["score_kind"] == NOTE_ON_KIND)
+            & (columns["performance_kind"] == NOTE_ON_KIND))
+    pairs = zip(columns["score_pos"][matched].tolist(), columns["performance_pos"][matched].tolist())
+    correct = sum(1 for i, j in pairs if truth.get(j) == i)
+    predicted = int(matched.sum())
+    precision = correct / predicted if predicted else 0.0
+    recall = correct / len(truth) if truth else 0.0
+    return {"correct": correct, "predicted": predicted, "expected": len(truth), "precision": precision,
+            "recall": recall, "f1": 2 * precision * recall / (precision + recall) if correct else 0.0}
+
+# Sum of accuracies.
+def total_accuracy(accuracies):
+    correct, predicted, expected = (sum(result[field] for result in accuracies)
+            for field in ("correct", "predicted", "expected"))
+    precision = correct / predicted if predicted else 0.0
+    recall = correct / expected if expected else 0.0
+    return {"correct": correct, "predicted": predicted, "expected": expected, "precision": precision,
+            "recall": recall, "f1": 2 * precision * recall / (precision + recall) if correct else 0.0}
+
+if __name__ == '__main__':
+
+    import argparse
+    from alignment import align_levenshtein, align_sorted, align_unsorted
+    from batch import corpus_pairs, load_score, load_track
+
+    parser = argparse.ArgumentParser(description='Compares alignments of a corpus with the pairs of its .match files.')
+    parser.add_argument('corpus_dir', type=str, nargs='?', default="../data/match_midi",
+                        help='directory with <piece>_score.mid and <piece>_pNN.mid files')
+    parser.add_argument('match_dir', type=str, nargs='?', default="../data/match",
+                        help='directory with the <piece>_pNN.match files the corpus was made of')
+    parser.add_argument('--max-gap-size', '-g', dest='max_gap_size', type=int, default=10)
+    parser.add_argument('--max-unmatched', '-u', dest='max_unmatched', type=int, default=20)
+
+    args = parser.parse_args()
+    aligners = {
+        "find_matching": lambda gold, other: align_unsorted(gold, other, args.max_gap_size, args.max_unmatched),
+        "find_matching_sorted": lambda gold, other: align_sorted(gold, other, args.max_gap_size, args.max_unmatched),
+        "match_levenshtein": align_levenshtein
+    }
+    results = {name: [] for name in aligners}
+    for score_file, performance_file in corpus_pairs(args.corpus_dir):
+        score_match, performance_match = pair_match_files(args.match_dir, score_file, performance_file)
+        truth = ground_truth(MatchFile(score_match, fast=True, lazy=True),
+                MatchFile(performance_match, fast=True, lazy=True))
+        gold, other = load_score(score_file), load_track(performance_file)
+        line = [os.path.basename(performance_file)]
+        for name, aligner in aligners.items():
+            results[name].append(accuracy(aligner(gold, other), truth))
+            line.append("{} {:.3f}".format(name, results[name][-1]["f1"]))
+        print(*line)
+    for name, accuracies in results.items():
+        print("{:<20} precision {precision:.4f} recall {recall:.4f} f1 {f1:.4f}".format(name, **total_accuracy(accuracies)))
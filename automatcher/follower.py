@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+
+import asyncio, time
+from collections import deque
+from automatcher import Event, TrackIterator, UnmatchedEvents, index_targets, default_event_filter, show_event
+
+class ScoreFollower:
+    # Follows a performance against a preprocessed score one event at a time. Decisions are the same
+    # (score event, performance event) pairs and symbols find_matching_sorted returns, feeding a whole
+    # performance and calling finish() gives the same pairs as match_two_sorted:
+    #   (score, performance) matched, symbol "!" if the performance event was matched from unmatched
+    #   (None, performance)  inserted (for now, it is kept as unmatched and may be matched later)
+    #   (score, None)        deleted
+    # Without max_gap_size and max_unmatched the state is not bounded. groups are precomputed chords of the
+    # score like match_two_sorted takes.
+    def __init__(self, score, max_gap_size=10, max_unmatched=20, latency_window=1000, groups=None):
+        self.score_iter = TrackIterator(score, groups)
+        self.max_gap_size = max_gap_size
+        self.max_unmatched = max_unmatched
+        self.pending = deque() # performance events not yet compared to the current chord
+        self.unmatched_events = UnmatchedEvents()
+        self.maybe_unmatched = []
+        self.targets = None
+        self.finished = False
+        self.closed = False
+        self.position = None # pos of the last matched score event
+        self.events_fed = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.max_latency = 0.0
+        self._start_chord([], [])
+
+    def _start_chord(self, decisions, symbols):
+        try:
+            self.targets = self.score_iter.get_next_events()
+        except StopIteration:
+            self.targets = None
+            self.finished = True
+            return
+        self.matched = [False for target in self.targets]
+        self.free_targets = index_targets(self.targets)
+        self.unmatched_events.trim(self.max_unmatched)
+        recovered = self.unmatched_events.recover_sorted(self.targets, self.free_targets, self.matched)
+        self.remaining = len(self.targets) - len(recovered)
+        for target_event, _ in recovered:
+            self.position = target_event.pos
+        decisions.extend(recovered)
+        symbols.extend("!" for _ in recovered)
+
+    def _end_chord(self, decisions, symbols):
+        deleted = [(target_event, None) for j, target_event in enumerate(self.targets) if not self.matched[j]]
+        decisions.extend(deleted)
+        symbols.extend(None for _ in deleted)
+        self.pending.extendleft(reversed(self.maybe_unmatched))
+        self.maybe_unmatched = []
+
+    def _run(self, decisions, symbols):
+        while not self.finished:
+            gap_exceeded = self.max_gap_size is not None and len(self.maybe_unmatched) > self.max_gap_size
+            if self.remaining == 0 or gap_exceeded or (self.closed and not self.pending):
+                self._end_chord(decisions, symbols)
+                self._start_chord(decisions, symbols)
+                continue
+            if not self.pending:
+                return
+            event = self.pending.popleft()
+            targets = self.free_targets.get(event.key)
+            if targets:
+                for unmatched_event in self.maybe_unmatched:
+                    unmatched_event.symbol = "U"
+                    decisions.append((None, unmatched_event))
+                    symbols.append(None)
+                self.unmatched_events.add(self.maybe_unmatched)
+                self.maybe_unmatched = []
+                j = targets.popleft()
+                decisions.append((self.targets[j], event))
+                symbols.append(None)
+                self.matched[j] = True
+                self.remaining -= 1
+                self.position = self.targets[j].pos
+            else:
+                self.maybe_unmatched.append(event)
+        # the score is over, nothing else can be matched
+        decisions.extend((None, event) for event in self.pending)
+        symbols.extend(None for _ in self.pending)
+        self.pending.clear()
+
+    # Feeds one performance Event, returns the decisions it caused and their symbols.
+    def feed(self, event):
+        start = time.perf_counter()
+        decisions = []
+        symbols = []
+        self.pending.append(event)
+        self.events_fed += 1
+        self._run(decisions, symbols)
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.max_latency = max(self.max_latency, latency)
+        return decisions, symbols
+
+    # Feeds a raw python-midi event (e.g. from a live port) received at the given time.
+    def feed_midi(self, midi_event, time):
+        if not default_event_filter(midi_event):
+            return [], []
+        return self.feed(Event(midi_event, self.events_fed, time))
+
+    # Ends the performance, returns the remaining decisions and their symbols. Performance events that were
+    # never matched are reported as (None, event) at the end.
+    def finish(self):
+        decisions = []
+        symbols = []
+        self.closed = True
+        self._run(decisions, symbols)
+        return decisions, symbols
+
+    # Yields (score event, performance event, symbol) for every decision.
+    def follow(self, events):
+        for event in events:
+            decisions, symbols = self.feed(event)
+            for (score_event, performance_event), symbol in zip(decisions, symbols):
+                yield score_event, performance_event, symbol
+        decisions, symbols = self.finish()
+        for (score_event, performance_event), symbol in zip(decisions, symbols):
+            yield score_event, performance_event, symbol
+
+    async def follow_async(self, events):
+        async for event in events:
+            decisions, symbols = self.feed(event)
+            for (score_event, performance_event), symbol in zip(decisions, symbols):
+                yield score_event, performance_event, symbol
+        decisions, symbols = self.finish()
+        for (score_event, performance_event), symbol in zip(decisions, symbols):
+            yield score_event, performance_event, symbol
+
+    def latency_stats(self):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {"events": 0, "mean": 0.0, "p99": 0.0, "max": 0.0}
+        return {
+            "events": self.events_fed,
+            "mean": sum(latencies) / len(latencies),
+            "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            "max": self.max_latency
+        }
+
+# Yields events of a preprocessed track at the pace given by their times, a stand-in for a live port.
+def replay(track, seconds_per_tick, speed=1.0):
+    start = time.perf_counter()
+    first_time = None
+    for event in track:
+        if first_time is None:
+            first_time = event.time
+        delay = (event.time - first_time) * seconds_per_tick / speed - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+        yield event
+
+async def replay_async(track, seconds_per_tick, speed=1.0):
+    start = time.perf_counter()
+    first_time = None
+    for event in track:
+        if first_time is None:
+            first_time = event.time
+        delay = (event.time - first_time) * seconds_per_tick / speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield event
+
+if __name__ == '__main__':
+
+    import argparse
+    from automatcher import read_track
+    from midifile import read_notes
+
+    parser = argparse.ArgumentParser(description='Follows a recorded performance against a score as if it was played live.')
+    parser.add_argument('score_file', type=str,
+                        help='score .mid file')
+    parser.add_argument('performance_file', type=str,
+                        help='performance .mid file that is replayed')
+    parser.add_argument('--speed', '-s', dest='speed', type=float, default=1.0,
+                        help='replay speed, 0 replays as fast as possible')
+    parser.add_argument('--max-gap-size', '-g', dest='max_gap_size', type=int, default=10)
+    parser.add_argument('--max-unmatched', '-u', dest='max_unmatched', type=int, default=20)
+    parser.add_argument('--quiet', '-q', action='store_const',
+                        default = False, const = True,
+                        help='only prints latency statistics')
+
+    args = parser.parse_args()
+    score = read_track(args.score_file)
+    performance = read_track(args.performance_file)
+    resolution = read_notes(args.performance_file).resolution
+    follower = ScoreFollower(score, max_gap_size=args.max_gap_size, max_unmatched=args.max_unmatched)
+    # default tempo of 120 bpm
+    events = replay(performance, 0.5 / resolution, args.speed) if args.speed > 0 else performance
+    for score_event, performance_event, symbol in follower.follow(events):
+        if not args.quiet:
+            print(show_event(score_event), show_event(performance_event, symbol), "@", follower.position)
+    stats = follower.latency_stats()
+    print("{} events, latency mean {:.1f}us, p99 {:.1f}us, max {:.1f}us".format(
+        stats["events"], stats["mean"] * 1e6, stats["p99"] * 1e6, stats["max"] * 1e6))
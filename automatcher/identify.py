@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+import os
+from collections import namedtuple
+import numpy as np
+from anchored import CHORD_TOLERANCE, MAX_NGRAM, chord_tops
+
+MAX_INTERVAL_NGRAM = 7 # intervals of an n-gram are packed into one int64, 8 bits each
+
+Candidate = namedtuple("Candidate", ["name", "votes", "offset"])
+
+class ScoreIndex:
+    # Inverted index of n-grams of chord top pitches (or of the intervals between them, which do not change
+    # when a piece is transposed) over a set of scores. Postings are kept sorted by n-gram code, so a query
+    # only looks up its own n-grams instead of comparing with every score.
+    def __init__(self, n=4, intervals=False, max_postings=1000):
+        max_n = MAX_INTERVAL_NGRAM if intervals else MAX_NGRAM
+        if not 0 < n <= max_n:
+            raise ValueError("n-grams can have 1 to {} {}.".format(max_n, "intervals" if intervals else "pitches"))
+        self.n = n
+        self.intervals = intervals
+        self.max_postings = max_postings # more common n-grams are ignored in queries
+        self.names = []
+        self.chord_positions = [] # per score, the position of the first event of every chord
+        self._added = [] # (codes, score ids, chord indices) not merged into the postings yet
+        self.codes = self.score_ids = self.chord_indices = np.zeros(0, dtype=np.int64)
+
+    def _ngrams(self, track, time_tolerance):
+        positions, pitches = chord_tops(track, time_tolerance)
+        pitches = pitches.astype(np.int64)
+        bits = 7
+        if self.intervals:
+            pitches = np.diff(pitches) + 128
+            bits = 8
+        count = max(len(pitches) - self.n + 1, 0)
+        codes = np.zeros(count, dtype=np.int64)
+        for k in range(self.n):
+            codes = (codes << bits) | pitches[k:k + count]
+        return positions, codes
+
+    def add(self, name, score, time_tolerance=0):
+        positions, codes = self._ngrams(score, time_tolerance)
+        score_id = len(self.names)
+        self.names.append(name)
+        self.chord_positions.append(positions)
+        self._added.append((codes, np.full(len(codes), score_id), np.arange(len(codes))))
+
+    def _merge(self):
+        if not self._added:
+            return
+        codes, score_ids, chord_indices = (np.concatenate(columns) for columns in zip(
+                (self.codes, self.score_ids, self.chord_indices), *self._added))
+        order = np.argsort(codes, kind="stable")
+        self.codes, self.score_ids, self.chord_indices = codes[order], score_ids[order], chord_indices[order]
+        self._added = []
+
+    # The k scores most n-grams of the performance vote for. Votes of a score are the hits near its best
+    # diagonal (score chord - performance chord, within two steps of slack chords as performances split and
+    # merge chords), offset is the position of the score event where the performance starts on that diagonal.
+    def query(self, performance, k=5, time_tolerance=CHORD_TOLERANCE, slack=16):
+        self._merge()
+        _, codes = self._ngrams(performance, time_tolerance)
+        starts = np.searchsorted(self.codes, codes, side="left")
+        ends = np.searchsorted(self.codes, codes, side="right")
+        lengths = ends - starts
+        keep = (lengths > 0) & (lengths <= self.max_postings)
+        starts, lengths, query_chords = starts[keep], lengths[keep], np.flatnonzero(keep)
+        if len(starts) == 0:
+            return []
+        # postings of all hits: posting i of query n-gram q is at starts[q] + i
+        hit_query = np.repeat(np.arange(len(starts)), lengths)
+        hits = starts[hit_query] + np.arange(len(hit_query)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        score_ids = self.score_ids[hits]
+        diagonals = self.chord_indices[hits] - query_chords[hit_query]
+        buckets = np.floor_divide(diagonals, slack)
+        pairs, votes = np.unique(np.stack((score_ids, buckets)), axis=1, return_counts=True)
+        counts = dict(zip(map(tuple, pairs.T.tolist()), votes.tolist()))
+        best = {}
+        for (score_id, bucket), count in counts.items():
+            count += counts.get((score_id, bucket + 1), 0)
+            if count > best.get(score_id, (0, 0))[0]:
+                best[score_id] = (count, bucket)
+        result = []
+        for score_id, (count, bucket) in sorted(best.items(), key=lambda item: -item[1][0])[:k]:
+            near = (score_ids == score_id) & (buckets >= bucket) & (buckets <= bucket + 1)
+            chord = max(int(np.median(diagonals[near])), 0)
+            positions = self.chord_positions[score_id]
+            offset = int(positions[min(chord, len(positions) - 1)]) if len(positions) else 0
+            result.append(Candidate(self.names[score_id], count, offset))
+        return result
+
+# An index of the scores of a corpus (<piece>_score.mid or the score notes of the first <piece>_pNN.match).
+def index_corpus(corpus_dir, n=4, intervals=False, cache=None):
+    from batch import corpus_pairs, load_track
+    index = ScoreIndex(n, intervals)
+    for score_file in sorted({score_file for score_file, _ in corpus_pairs(corpus_dir)}):
+        name = os.path.basename(score_file).rsplit("_", 1)[0]
+        index.add(name, load_track(score_file, score_notes=True, cache=cache))
+    return index
+
+if __name__ == '__main__':
+
+    import argparse, time
+    from batch import load_track
+
+    parser = argparse.ArgumentParser(description='Finds the scores of a corpus that performances belong to.')
+    parser.add_argument('performance_files', type=str, nargs='+',
+                        help='performance .mid or .match files')
+    parser.add_argument('--corpus', '-c', dest='corpus_dir', type=str, default="../data/match_midi",
+                        help='directory with <piece>_score.mid and <piece>_pNN.mid files or <piece>_pNN.match files')
+    parser.add_argument('--top', '-k', dest='k', type=int, default=3,
+                        help='number of candidates')
+    parser.add_argument('--ngram', '-n', dest='n', type=int, default=4,
+                        help='number of chords in an n-gram')
+    parser.add_argument('--intervals', '-i', action='store_const',
+                        default = False, const = True,
+                        help='indexes intervals between chords instead of pitches (transposition invariant)')
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    index = index_corpus(args.corpus_dir, args.n, args.intervals)
+    print("{} scores indexed in {:.3f}s".format(len(index.names), time.perf_counter() - start))
+    for performance_file in args.performance_files:
+        start = time.perf_counter()
+        candidates = index.query(load_track(performance_file), args.k)
+        print(os.path.basename(performance_file), "{:.1f}ms".format((time.perf_counter() - start) * 1000),
+                *("{} ({} votes, at {})".format(*candidate) for candidate in candidates))
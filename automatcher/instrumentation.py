@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+import json, time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# Counters and phase timers of the matchers. Nothing is counted unless a MatchStats is passed to them
+# (TrackIterator(..., stats=...), match, match_two_sorted, match_levenshtein), without one the matchers only
+# check for None once per chord. callback(name, data) is called for every chord and phase, e.g. to export
+# them as a trace.
+class MatchStats:
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.counters = Counter()
+        self.gaps = Counter() # length of the runs of unmatched events before a match -> number of runs
+        self.unmatched_sizes = Counter() # size of the unmatched buffer after a chord -> number of chords
+        self.timers = Counter() # phase -> seconds
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def gap(self, length):
+        self.gaps[length] += 1
+
+    # One find_matching(_sorted) call: events read from the performance, dictionary lookups of keys (of the
+    # events read among the targets and of the targets among the unmatched events), events recovered from
+    # unmatched ("!"), whether it stopped at max_gap_size, the events pushed back and the unmatched events kept.
+    def chord(self, targets, read, key_lookups, recovered, gap_limited, pushed_back, unmatched):
+        counters = self.counters
+        counters["chords"] += 1
+        counters["targets"] += targets
+        counters["events_read"] += read
+        counters["key_lookups"] += key_lookups
+        counters["recovered"] += recovered
+        counters["gap_limited"] += gap_limited
+        counters["pushed_back"] += pushed_back
+        self.unmatched_sizes[unmatched] += 1
+        if self.callback is not None:
+            self.callback("chord", {"targets": targets, "read": read, "key_lookups": key_lookups,
+                    "recovered": recovered, "gap_limited": gap_limited, "pushed_back": pushed_back,
+                    "unmatched": unmatched})
+
+    def time(self, phase, seconds):
+        self.timers[phase] += seconds
+        if self.callback is not None:
+            self.callback("phase", {"phase": phase, "seconds": seconds})
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.time(name, time.perf_counter() - start)
+
+    # Adds the counts of another MatchStats or of its as_dict() (e.g. from a worker process).
+    def merge(self, other):
+        if isinstance(other, MatchStats):
+            other = other.as_dict()
+        self.counters.update(other["counters"])
+        self.gaps.update({int(length): count for length, count in other["gaps"].items()})
+        self.unmatched_sizes.update({int(size): count for size, count in other["unmatched_sizes"].items()})
+        self.timers.update(other["timers"])
+
+    def as_dict(self):
+        return {"counters": dict(self.counters), "gaps": dict(sorted(self.gaps.items())),
+                "unmatched_sizes": dict(sorted(self.unmatched_sizes.items())), "timers": dict(self.timers)}
+
+    def summary(self):
+        counters = self.counters
+        lines = ["{:<18} {}".format(name, counters[name]) for name in sorted(counters)]
+        if self.gaps:
+            lines.append("{:<18} {} runs, longest {}, mean {:.2f}".format("gaps", sum(self.gaps.values()),
+                    max(self.gaps), sum(length * count for length, count in self.gaps.items()) / sum(self.gaps.values())))
+        if self.unmatched_sizes:
+            lines.append("{:<18} largest {}, mean {:.2f}".format("unmatched", max(self.unmatched_sizes),
+                    sum(size * count for size, count in self.unmatched_sizes.items()) / sum(self.unmatched_sizes.values())))
+        lines += ["{:<18} {:.3f}s".format(phase, seconds) for phase, seconds in self.timers.items()]
+        return "\n".join(lines)
+
+# stats.phase(name), or nothing when stats is None.
+def phase(stats, name):
+    return stats.phase(name) if stats is not None else nullcontext()
+
+# A callback for MatchStats that writes every chord and phase as a line of JSON to output (an open file).
+def json_lines_callback(output):
+    def callback(name, data):
+        output.write(json.dumps(dict(data, event=name)))
+        output.write("\n")
+    return callback
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+
+import mmap, struct
+import numpy as np
+from collections import namedtuple
+
+# NoteOn/NoteOff messages of one track of a standard MIDI file. tick is the delta time of the message
+# (the time since the previous event of any kind, like python-midi event.tick).
+MidiNotes = namedtuple("MidiNotes", ["resolution", "tick", "is_off", "pitch", "velocity"])
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+# data bytes of channel messages by command, system common messages (not allowed in files) by status
+DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xa0: 2, 0xb0: 2, 0xc0: 1, 0xd0: 1, 0xe0: 2}
+SYSTEM_DATA_LENGTHS = {0xf1: 1, 0xf2: 2, 0xf3: 1}
+
+def _track_chunks(data):
+    position = 8 + struct.unpack_from(">L", data, 4)[0]
+    while position + 8 <= len(data):
+        chunk_type, length = struct.unpack_from(">4sL", data, position)
+        position += 8
+        if chunk_type == b"MTrk": # other chunk types are skipped as the standard asks
+            yield position, min(position + length, len(data))
+        position += length
+
+# Decodes only the NoteOn/NoteOff messages of a track, every other event is skipped without building
+# anything. The file is memory-mapped. With zero_velocity_off a NoteOn with velocity 0 is a NoteOff
+# (python-midi keeps it a NoteOn, so does preprocess).
+def read_notes(filename, track_index=0, zero_velocity_off=False):
+    with open(filename, "rb") as midi_file, mmap.mmap(midi_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:4] != b"MThd":
+            raise ValueError("Not a MIDI file: {}".format(filename))
+        _, _, resolution = struct.unpack_from(">HHH", data, 8)
+        for n, (start, end) in enumerate(_track_chunks(data)):
+            if n == track_index:
+                break
+        else:
+            raise IndexError("{} has no track {}".format(filename, track_index))
+
+        ticks, is_off, pitches, velocities = [], [], [], []
+        position = start
+        status = 0
+        while position < end:
+            byte = data[position]
+            position += 1
+            delta = byte & 0x7f
+            while byte & 0x80:
+                byte = data[position]
+                position += 1
+                delta = (delta << 7) | (byte & 0x7f)
+            byte = data[position]
+            if byte & 0x80:
+                position += 1
+                if byte >= 0xf0:
+                    if byte == 0xff: # meta event: type, length, data
+                        position += 1
+                    elif byte not in (0xf0, 0xf7): # system common, sysex events are length, data too
+                        position += SYSTEM_DATA_LENGTHS.get(byte, 0)
+                        continue
+                    length = 0
+                    while True:
+                        byte = data[position]
+                        position += 1
+                        length = (length << 7) | (byte & 0x7f)
+                        if not byte & 0x80:
+                            break
+                    position += length
+                    continue
+                status = byte
+            elif status == 0:
+                raise ValueError("Data byte without status at {} in {}".format(position, filename))
+            command = status & 0xf0
+            if command == NOTE_ON or command == NOTE_OFF: # the data bytes follow, running status or not
+                velocity = data[position + 1]
+                ticks.append(delta)
+                is_off.append(command == NOTE_OFF or (zero_velocity_off and velocity == 0))
+                pitches.append(data[position])
+                velocities.append(velocity)
+            position += DATA_LENGTHS[command]
+
+    return MidiNotes(resolution, np.array(ticks, dtype=np.int32), np.array(is_off, dtype=np.uint8),
+            np.array(pitches, dtype=np.uint8), np.array(velocities, dtype=np.uint8))
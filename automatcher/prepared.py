@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from automatcher import TrackIterator, event_keys, group_events
+
+class PreparedScore:
+    # A preprocessed score with everything the matchers need precomputed once: its chords (group_events,
+    # optionally with a time tolerance), a key -> positions index and, taken from it, the target index of every chord.
+    # Aligning does not change it, so it can be shared by any number of performances.
+    def __init__(self, score, time_tolerance=None):
+        self.events = list(score)
+        self.groups = group_events(self.events, time_tolerance)
+        self.keys = event_keys(self.events)
+        order = np.argsort(self.keys, kind="stable")
+        keys, starts = np.unique(self.keys[order], return_index=True)
+        self.positions = dict(zip(keys.tolist(), np.split(order, starts[1:])))
+        self.starts = np.cumsum([0] + [len(group) for group in self.groups])
+        self.targets = [self._chord_targets(start, start + len(group)) for start, group in zip(self.starts.tolist(), self.groups)]
+
+    def __len__(self):
+        return len(self.events)
+
+    # Positions of the score events with the given key (kind * 128 + pitch), in order.
+    def positions_of(self, key):
+        return self.positions.get(key, np.zeros(0, dtype=np.int64))
+
+    # index_targets of the chord of score events start to end, keys in the same order, from the positions index.
+    def _chord_targets(self, start, end):
+        targets = {}
+        for key in dict.fromkeys(self.keys[start:end].tolist()):
+            positions = self.positions[key]
+            chord = positions[np.searchsorted(positions, start):np.searchsorted(positions, end)]
+            targets[key] = tuple((chord - start).tolist())
+        return targets
+
+    def _free_targets(self, i):
+        return {key: deque(targets) for key, targets in self.targets[i].items()}
+
+    # The chords and their symbols match_two_sorted returns for this score and the performance, without printing
+    # them. Performance events the score never got to are added as a last chord of (None, event) pairs.
+    # stats is an optional instrumentation.MatchStats for the TrackIterators.
+    def align(self, performance, max_gap_size=None, max_unmatched=None, stats=None):
+        return self.align_together([performance], max_gap_size, max_unmatched, stats)[0]
+
+    # align() of every performance in one pass over the score.
+    def align_together(self, performances, max_gap_size=None, max_unmatched=None, stats=None):
+        iterators = [TrackIterator(performance, stats=stats) for performance in performances]
+        results = [([], []) for performance in performances]
+        for i, group in enumerate(self.groups):
+            for iterator, (all_matched, all_symbols) in zip(iterators, results):
+                matched, symbols = iterator.find_matching_sorted(group, max_gap_size, max_unmatched,
+                        free_targets=self._free_targets(i))
+                all_matched.append(matched)
+                all_symbols.append(symbols)
+        for iterator, (all_matched, all_symbols) in zip(iterators, results):
+            remaining = list(iterator.pending) + list(iterator.iterator)
+            if remaining:
+                all_matched.append([(None, event) for event in remaining])
+                all_symbols.append([None] * len(remaining))
+        return results
+
+    # The pairs match() prints for this score and the performance (find_matching) and their symbols, chord by
+    # chord. Performance events that were never matched are added as a last chord of (None, event) pairs.
+    def align_unsorted(self, performance, max_gap_size=None, max_unmatched=None, stats=None):
+        iterator = TrackIterator(performance, stats=stats)
+        all_matched = []
+        all_symbols = []
+        for i, group in enumerate(self.groups):
+            events, symbols = iterator.find_matching(group, max_gap_size, max_unmatched,
+                    free_targets=self._free_targets(i))
+            all_matched.append(list(zip(group, events)))
+            all_symbols.append(symbols)
+        matched = {event.pos for pairs in all_matched for _, event in pairs if event is not None}
+        remaining = [event for event in performance if event.pos not in matched]
+        if remaining:
+            all_matched.append([(None, event) for event in remaining])
+            all_symbols.append([None] * len(remaining))
+        return all_matched, all_symbols
+
+    # align() of every performance in a process pool. The score is sent to every worker once, then only
+    # performances (best as columnar Tracks) and their alignments are.
+    def align_all(self, performances, max_gap_size=None, max_unmatched=None, workers=None):
+        if workers == 1:
+            return [self.align(performance, max_gap_size, max_unmatched) for performance in performances]
+        jobs = [(performance, max_gap_size, max_unmatched) for performance in performances]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_score, initargs=(self,)) as executor:
+            chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+            return list(executor.map(_align_performance, jobs, chunksize=chunksize))
+
+_worker_score = None
+
+def _set_worker_score(prepared_score):
+    global _worker_score
+    _worker_score = prepared_score
+
+def _align_performance(arguments):
+    return _worker_score.align(*arguments)
+
+if __name__ == '__main__':
+
+    import argparse, glob, time
+    from automatcher import read_track
+
+    parser = argparse.ArgumentParser(description='Aligns all performances of a piece with its score.')
+    parser.add_argument('piece', type=str,
+                        help='<piece> of <piece>_score.mid and <piece>_pNN.mid, e.g. ../data/match_midi/Chopin_op38')
+    parser.add_argument('--workers', '-w', dest='workers', type=int, default=None,
+                        help='number of worker processes, number of CPUs by default, 0 aligns in one pass')
+    parser.add_argument('--max-gap-size', '-g', dest='max_gap_size', type=int, default=10)
+    parser.add_argument('--max-unmatched', '-u', dest='max_unmatched', type=int, default=20)
+    parser.add_argument('--chord-tolerance', '-t', dest='chord_tolerance', type=int, default=None,
+                        help='score events at most this many ticks apart are one chord, by default only events at the same tick')
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    score = PreparedScore(read_track(args.piece + "_score.mid"), args.chord_tolerance)
+    performances = [read_track(filename, columnar=True) for filename in sorted(glob.glob(args.piece + "_p[0-9]*.mid"))]
+    loaded = time.perf_counter()
+    if args.workers == 0:
+        results = score.align_together(performances, args.max_gap_size, args.max_unmatched)
+    else:
+        results = score.align_all(performances, args.max_gap_size, args.max_unmatched, args.workers)
+    elapsed = time.perf_counter() - loaded
+    for performance, (all_matched, _) in zip(performances, results):
+        matched = sum(1 for pairs in all_matched for score_event, event in pairs if score_event and event)
+        print("{:>6} events, {:>6} matched".format(len(performance), matched))
+    print("{} performances loaded in {:.3f}s, aligned in {:.3f}s".format(len(performances), loaded - start, elapsed))
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+
+import csv, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from alignment import Alignment
+from automatcher import read_track
+from batch import corpus_pairs
+from evaluation import accuracy, ground_truth, pair_match_files, total_accuracy
+from prepared import PreparedScore
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "match_to_midi"))
+from match_to_midi import MatchFile
+
+MATCHERS = ("sorted", "unsorted")
+
+# Every score of the corpus as a PreparedScore, every performance as a columnar Track with its ground truth,
+# each loaded and preprocessed once: (scores, [(score index, performance name, performance, truth)]).
+def load_corpus(corpus_dir, match_dir, chord_tolerance=None, limit=None):
+    scores, score_indices, pairs = [], {}, []
+    for score_file, performance_file in list(corpus_pairs(corpus_dir))[:limit]:
+        if score_file not in score_indices:
+            score_indices[score_file] = len(scores)
+            scores.append(PreparedScore(read_track(score_file), chord_tolerance))
+        score_match, performance_match = pair_match_files(match_dir, score_file, performance_file)
+        truth = ground_truth(MatchFile(score_match, fast=True, lazy=True), MatchFile(performance_match, fast=True, lazy=True))
+        pairs.append((score_indices[score_file], os.path.basename(performance_file),
+                read_track(performance_file, columnar=True), truth))
+    return scores, pairs
+
+_worker_corpus = None
+
+def _set_worker_corpus(corpus):
+    global _worker_corpus
+    _worker_corpus = corpus
+
+def _align_job(arguments):
+    # Only the indices and parameters are sent for every job, the corpus is in the worker already.
+    pair, matcher, max_gap_size, max_unmatched = arguments
+    scores, pairs = _worker_corpus
+    score_index, _, performance, truth = pairs[pair]
+    score = scores[score_index]
+    start = time.perf_counter()
+    if matcher == "sorted":
+        all_matched, all_symbols = score.align(performance, max_gap_size, max_unmatched)
+    else:
+        all_matched, all_symbols = score.align_unsorted(performance, max_gap_size, max_unmatched)
+    elapsed = time.perf_counter() - start
+    alignment = Alignment.from_chords(score.events, performance, all_matched, all_symbols)
+    return arguments, elapsed, accuracy(alignment, truth)
+
+# Aligns every pair of the corpus with every combination of the parameter grids in a process pool (workers=1
+# aligns in this process). Returns a row per combination: parameters, pairs, notes, seconds (sum of the
+# alignment times), notes/s, the slowest pair and the accuracy over all pairs.
+def sweep(corpus, max_gap_sizes, max_unmatcheds, matchers=("sorted",), workers=None):
+    scores, pairs = corpus
+    parameters = list(product(matchers, max_gap_sizes, max_unmatcheds))
+    jobs = [(pair,) + combination for combination in parameters for pair in range(len(pairs))]
+    if workers == 1:
+        _set_worker_corpus(corpus)
+        results = list(map(_align_job, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_corpus, initargs=(corpus,)) as executor:
+            chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+            results = list(executor.map(_align_job, jobs, chunksize=chunksize))
+
+    by_parameters = {combination: [] for combination in parameters}
+    for (pair, *combination), elapsed, pair_accuracy in results:
+        by_parameters[tuple(combination)].append((pair, elapsed, pair_accuracy))
+    rows = []
+    for (matcher, max_gap_size, max_unmatched), pair_results in by_parameters.items():
+        notes = sum(len(scores[pairs[pair][0]]) + len(pairs[pair][2]) for pair, _, _ in pair_results)
+        seconds = sum(elapsed for _, elapsed, _ in pair_results)
+        slowest, slowest_seconds = max(((pairs[pair][1], elapsed) for pair, elapsed, _ in pair_results),
+                key=lambda item: item[1])
+        row = {"matcher": matcher, "max_gap_size": max_gap_size, "max_unmatched": max_unmatched,
+                "pairs": len(pair_results), "notes": notes, "seconds": seconds,
+                "notes_per_second": notes / seconds if seconds else None, "slowest": slowest,
+                "slowest_seconds": slowest_seconds}
+        row.update(total_accuracy([pair_accuracy for _, _, pair_accuracy in pair_results]))
+        rows.append(row)
+    return rows
+
+# The most accurate row whose slowest pair takes at most latency seconds (any row without a latency).
+def best_row(rows, latency=None):
+    rows = [row for row in rows if latency is None or row["slowest_seconds"] <= latency]
+    return max(rows, key=lambda row: (row["f1"], -row["seconds"])) if rows else None
+
+def write_rows(rows, filename):
+    with open(filename, "w", newline="") as output:
+        writer = csv.DictWriter(output, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _grid_value(text):
+    # "none" is no limit
+    return None if text.lower() == "none" else int(text)
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Aligns a corpus with every combination of max_gap_size and '
+                        'max_unmatched and compares speed and accuracy against the pairs of the .match files.')
+    parser.add_argument('corpus_dir', type=str, nargs='?', default="../data/match_midi",
+                        help='directory with <piece>_score.mid and <piece>_pNN.mid files')
+    parser.add_argument('match_dir', type=str, nargs='?', default="../data/match",
+                        help='directory with the <piece>_pNN.match files the corpus was made of')
+    parser.add_argument('--max-gap-size', '-g', dest='max_gap_sizes', type=_grid_value, nargs='+',
+                        default=[2, 5, 10, 20, 50], help='values of max_gap_size, "none" is no limit')
+    parser.add_argument('--max-unmatched', '-u', dest='max_unmatcheds', type=_grid_value, nargs='+',
+                        default=[5, 10, 20, 50, 0], help='values of max_unmatched, 0 keeps all unmatched events')
+    parser.add_argument('--matchers', '-m', dest='matchers', nargs='+', default=['sorted'], choices=MATCHERS,
+                        help='"sorted" is find_matching_sorted (match_two_sorted), "unsorted" find_matching (match)')
+    parser.add_argument('--chord-tolerance', '-t', dest='chord_tolerance', type=int, default=None,
+                        help='score events at most this many ticks apart are one chord, by default only events at the same tick')
+    parser.add_argument('--workers', '-w', dest='workers', type=int, default=None,
+                        help='number of worker processes, number of CPUs by default')
+    parser.add_argument('--limit', '-l', dest='limit', type=int, default=None,
+                        help='only aligns the first LIMIT pairs')
+    parser.add_argument('--latency', dest='latency', type=float, default=None,
+                        help='latency budget: the best settings are picked among the ones whose slowest pair '
+                        'takes at most this many seconds')
+    parser.add_argument('--output', '-o', dest='output_file', type=str, default=None,
+                        help='CSV file for the table')
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    corpus = load_corpus(args.corpus_dir, args.match_dir, args.chord_tolerance, args.limit)
+    loaded = time.perf_counter()
+    rows = sweep(corpus, args.max_gap_sizes, args.max_unmatcheds, args.matchers, args.workers)
+    elapsed = time.perf_counter() - loaded
+    print("{:<8} {:>4} {:>4} {:>8} {:>9} {:>8} {:>9} {:>9} {:>9}".format("matcher", "gap", "unm", "seconds",
+            "notes/s", "slowest", "precision", "recall", "f1"))
+    for row in rows:
+        print("{matcher:<8} {0:>4} {1:>4} {seconds:>8.3f} {notes_per_second:>9.0f} {slowest_seconds:>8.4f} "
+                "{precision:>9.4f} {recall:>9.4f} {f1:>9.4f}".format(str(row["max_gap_size"]),
+                str(row["max_unmatched"]), **row))
+    best = best_row(rows, args.latency)
+    if best is not None:
+        print("best: {matcher} max_gap_size={max_gap_size} max_unmatched={max_unmatched} f1 {f1:.4f}, "
+                "slowest pair {slowest} {slowest_seconds:.4f}s".format(**best))
+    else:
+        print("no settings within the latency budget")
+    print("{} pairs loaded in {:.3f}s, {} alignments in {:.3f}s".format(len(corpus[1]), loaded - start,
+            len(rows) * len(corpus[1]), elapsed))
+    if args.output_file is not None and rows:
+        write_rows(rows, args.output_file)
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+import csv, json, os, sys, tempfile, unittest
+from automatcher import Event, NOTE_ON_KIND, NOTE_OFF_KIND, read_track, events_from_match, show_event
+from alignment import (Alignment, MATCH, INSERTED, DELETED, OP_NAMES, align_levenshtein, align_sorted, write_csv,
+        write_jsonl, write_match)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "match_to_midi"))
+from match_to_midi import MatchFile
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "match_midi")
+
+# Events of notes given as (pitch, onset, offset) ticks, in time order like preprocess returns them.
+def note_track(notes):
+    events = sorted([(onset, NOTE_ON_KIND, pitch) for pitch, onset, _ in notes]
+            + [(offset, NOTE_OFF_KIND, pitch) for pitch, _, offset in notes])
+    result = []
+    previous = 0
+    for pos, (time, kind, pitch) in enumerate(events):
+        result.append(Event(None, pos, time, key=kind * 128 + pitch, tick=time - previous))
+        previous = time
+    return result
+
+def event_tuples(track):
+    return [(event.pos, event.time, event.key) for event in track]
+
+# Pitch of the event at index i of an alignment row, None without an event (-1).
+def row_pitch(track, i):
+    return None if i < 0 else track[i].key % 128
+
+def is_note_on(track, i):
+    return i < 0 or track[i].key // 128 == NOTE_ON_KIND
+
+class AlignmentTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.score = note_track([(60, 0, 100), (64, 100, 200), (67, 200, 300)])
+        self.performance = note_track([(60, 0, 90), (65, 95, 150), (67, 210, 320)])
+        # score 64 deleted, performance 65 inserted
+        self.alignment = align_levenshtein(self.score, self.performance)
+
+    def test_ops(self):
+        ops = [OP_NAMES[op] for op in self.alignment.op.tolist()]
+        self.assertEqual(ops.count("match"), 4)
+        self.assertEqual(ops.count("deleted"), 2)
+        self.assertEqual(ops.count("inserted"), 2)
+        self.assertEqual(sorted(i for i in self.alignment.score_index.tolist() if i >= 0), list(range(6)))
+        self.assertEqual(sorted(j for j in self.alignment.performance_index.tolist() if j >= 0), list(range(6)))
+
+    def test_lines(self):
+        lines = list(self.alignment.lines())
+        self.assertEqual(len(lines), len(self.alignment))
+        for line, i, j, op in zip(lines, self.alignment.score_index.tolist(),
+                self.alignment.performance_index.tolist(), self.alignment.op.tolist()):
+            symbol = {MATCH: None, DELETED: "+", INSERTED: "-"}[op]
+            expected = show_event(self.score[i], symbol) if i >= 0 else show_event(None)
+            expected += " " + (show_event(self.performance[j], symbol) if j >= 0 else show_event(None))
+            self.assertEqual(line, expected)
+
+    def test_csv(self):
+        filename = os.path.join(self.directory, "alignment.csv")
+        write_csv(self.alignment, filename)
+        with open(filename, newline="") as source:
+            rows = list(csv.DictReader(source))
+        columns = self.alignment.columns()
+        self.assertEqual(list(rows[0]), list(columns))
+        self.assertEqual([row["op"] for row in rows], [OP_NAMES[op] for op in columns["op"].tolist()])
+        for name in list(columns)[1:]:
+            self.assertEqual([int(row[name]) for row in rows], columns[name].tolist())
+
+    def test_jsonl(self):
+        filename = os.path.join(self.directory, "alignment.jsonl")
+        write_jsonl(self.alignment, filename)
+        with open(filename) as source:
+            rows = [json.loads(line) for line in source]
+        columns = self.alignment.columns()
+        self.assertEqual(len(rows), len(self.alignment))
+        self.assertEqual([row["op"] for row in rows], [OP_NAMES[op] for op in columns["op"].tolist()])
+        for name in list(columns)[1:]:
+            self.assertEqual([row[name] for row in rows], columns[name].tolist())
+
+    def test_match(self):
+        # the score and played notes of the written match file are the tracks again, pairs are the NoteOn rows
+        score = read_track(os.path.join(DATA_DIR, "Schubert_D783_no15_score.mid"))
+        performance = read_track(os.path.join(DATA_DIR, "Schubert_D783_no15_p01.mid"))
+        for alignment in (align_sorted(score, performance, 10, 20), align_levenshtein(score, performance)):
+            filename = os.path.join(self.directory, "alignment.match")
+            write_match(alignment, filename)
+            match_file = MatchFile(filename)
+            for score_notes, track in ((True, score), (False, performance)):
+                self.assertEqual(event_tuples(events_from_match(match_file, score_notes)), event_tuples(track))
+            rows = zip(alignment.score_index.tolist(), alignment.performance_index.tolist())
+            expected = [(row_pitch(score, i), row_pitch(performance, j)) for i, j in rows
+                    if is_note_on(score, i) and is_note_on(performance, j)]
+            pairs = [tuple(None if note is None else note.midi_note_number for note in notes)
+                    for notes in match_file.iter_matches()]
+            self.assertEqual(pairs, expected)
+
+    def test_from_pairs(self):
+        # a recovered event is in one row, its earlier (None, event) pair is left out
+        score, performance = self.score, self.performance
+        pairs = [(score[0], performance[0]), (None, performance[1]), (score[1], performance[1]), (score[2], None)]
+        alignment = Alignment.from_pairs(score, performance, pairs, [None, None, "!", None])
+        self.assertEqual([OP_NAMES[op] for op in alignment.op.tolist()], ["match", "recovered", "deleted"])
+        self.assertEqual(alignment.performance_index.tolist(), [0, 1, -1])
+
+if __name__ == '__main__':
+    unittest.main()
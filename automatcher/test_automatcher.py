@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+
+import random, unittest
+import automatcher
+from automatcher import Event, Track, levenshtein_distance, match_banded, match_levenshtein, show_event
+
+# Events of a preprocessed track with the given keys, one tick apart (or all at time 0).
+def make_track(keys, chord=False):
+    return [Event(None, i, 0 if chord else i, key=key, tick=0 if chord else 1) for i, key in enumerate(keys)]
+
+def random_keys(generator, length, alphabet=6):
+    return [generator.randrange(alphabet) for _ in range(length)]
+
+def shown(marked):
+    return list(map(show_event, *marked))
+
+# Length of the longest common subsequence of two key lists, the full dynamic programming table.
+def lcs_length(a, b):
+    row = [0] * (len(b) + 1)
+    for x in a:
+        previous = row[:]
+        for j, y in enumerate(b):
+            row[j + 1] = previous[j] + 1 if x == y else max(previous[j + 1], row[j])
+    return row[-1]
+
+class LevenshteinEnginesTest(unittest.TestCase):
+    def assertSameEngines(self, gold, other):
+        self.assertEqual(shown(match_levenshtein(gold, other, engine="table")), shown(match_levenshtein(gold, other)))
+
+    def test_random_tracks(self):
+        generator = random.Random(1)
+        for _ in range(50):
+            gold = make_track(random_keys(generator, generator.randrange(1, 40)))
+            other = make_track(random_keys(generator, generator.randrange(1, 40)))
+            self.assertSameEngines(gold, other)
+
+    def test_recursion(self):
+        # blocks of a few cells, every range is split until rows are traced one or two at a time
+        self.addCleanup(setattr, automatcher, "LINEAR_BLOCK_CELLS", automatcher.LINEAR_BLOCK_CELLS)
+        automatcher.LINEAR_BLOCK_CELLS = 7
+        generator = random.Random(2)
+        for _ in range(50):
+            gold = make_track(random_keys(generator, generator.randrange(1, 60), alphabet=3))
+            other = make_track(random_keys(generator, generator.randrange(1, 60), alphabet=3))
+            self.assertSameEngines(gold, other)
+
+    def test_columnar_track(self):
+        generator = random.Random(3)
+        gold = make_track(random_keys(generator, 30))
+        other = make_track(random_keys(generator, 35))
+        self.assertEqual(shown(match_levenshtein(Track.from_events(gold), Track.from_events(other))),
+                shown(match_levenshtein(gold, other, engine="table")))
+
+    def test_symbols(self):
+        gold, other = make_track([0, 1, 2, 3]), make_track([0, 1, 4, 3])
+        events, symbols = match_levenshtein(gold, other)
+        self.assertEqual([(event.pos, symbol) for event, symbol in zip(events, symbols)],
+                [(1, None), (2, "+"), (2, "-"), (3, None)])
+        self.assertTrue(all(event.symbol is None for event in gold + other))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            match_levenshtein(make_track([0]), make_track([0]), engine="quadratic")
+
+class BandedTest(unittest.TestCase):
+    def assertAlignment(self, gold, other, alignment):
+        # every gold event is matched or added and every other event matched or removed, in order (matched rows
+        # are other events)
+        pairs = list(zip(alignment.events, alignment.symbols))
+        self.assertEqual([event.pos for event, symbol in pairs if symbol != "+"], [event.pos for event in other])
+        self.assertEqual(sum(symbol != "-" for _, symbol in pairs), len(gold))
+        i = 0
+        for event, symbol in pairs:
+            if symbol == "+":
+                self.assertIs(event, gold[i])
+            elif symbol is None:
+                self.assertEqual(event.key, gold[i].key)
+            if symbol != "-":
+                i += 1
+
+    def test_full_band(self):
+        # With a band wider than the tracks every cell is evaluated. Events at the same time cost nothing to
+        # match, so the matches are a longest common subsequence.
+        generator = random.Random(4)
+        for _ in range(30):
+            gold = make_track(random_keys(generator, generator.randrange(1, 50), alphabet=4), chord=True)
+            other = make_track(random_keys(generator, generator.randrange(1, 50), alphabet=4), chord=True)
+            alignment = match_banded(gold, other, band_width=100)
+            self.assertEqual(alignment.cells, alignment.full_cells)
+            self.assertAlignment(gold, other, alignment)
+            self.assertEqual(alignment.symbols.count(None),
+                    lcs_length([event.key for event in gold], [event.key for event in other]))
+
+    def test_narrow_band(self):
+        generator = random.Random(5)
+        gold = make_track(random_keys(generator, 200))
+        other = make_track(random_keys(generator, 180))
+        alignment = match_banded(gold, other, band_width=8)
+        self.assertLess(alignment.cells, alignment.full_cells)
+        self.assertAlignment(gold, other, alignment)
+
+    def test_same_tracks(self):
+        gold = make_track(random_keys(random.Random(6), 100))
+        alignment = match_banded(gold, make_track([event.key for event in gold]), band_width=4)
+        self.assertEqual(alignment.symbols, [None] * len(gold))
+
+    def test_empty_track(self):
+        events = make_track([1, 2, 3])
+        self.assertEqual(match_banded([], events).symbols, ["-"] * 3)
+        self.assertEqual(match_banded(events, []).symbols, ["+"] * 3)
+
+class LevenshteinDistanceTest(unittest.TestCase):
+    def test_full_table(self):
+        # longer than a machine word, so the rows are several words of bits
+        generator = random.Random(7)
+        for _ in range(40):
+            gold_keys = random_keys(generator, generator.randrange(0, 150), alphabet=5)
+            other_keys = random_keys(generator, generator.randrange(0, 150), alphabet=5)
+            distance = len(gold_keys) + len(other_keys) - 2 * lcs_length(gold_keys, other_keys)
+            self.assertEqual(levenshtein_distance(make_track(gold_keys), make_track(other_keys)), distance)
+
+    def test_max_distance(self):
+        # never abandoned early when the distance is within max_distance
+        generator = random.Random(8)
+        for _ in range(40):
+            gold_keys = random_keys(generator, generator.randrange(1, 120), alphabet=4)
+            other_keys = gold_keys[:]
+            for _ in range(generator.randrange(0, 20)):
+                other_keys[generator.randrange(len(other_keys))] = generator.randrange(4)
+            gold, other = make_track(gold_keys), make_track(other_keys)
+            distance = levenshtein_distance(gold, other)
+            for max_distance in range(max(0, distance - 3), distance + 3):
+                expected = distance if distance <= max_distance else None
+                self.assertEqual(levenshtein_distance(gold, other, max_distance), expected)
+
+    def test_lengths(self):
+        self.assertIsNone(levenshtein_distance(make_track([1] * 10), make_track([1] * 3), max_distance=6))
+        self.assertEqual(levenshtein_distance(make_track([1] * 10), make_track([1] * 3), max_distance=7), 7)
+
+    def test_columnar_track(self):
+        generator = random.Random(9)
+        gold, other = make_track(random_keys(generator, 90)), make_track(random_keys(generator, 70))
+        self.assertEqual(levenshtein_distance(Track.from_events(gold), Track.from_events(other)),
+                levenshtein_distance(gold, other))
+
+if __name__ == '__main__':
+    unittest.main()
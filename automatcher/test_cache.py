@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+import os, shutil, sys, tempfile, unittest
+import numpy as np
+from automatcher import Track, read_track, events_from_match
+from cache import TrackCache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "match_to_midi"))
+from match_to_midi import MatchFile
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+MIDI_FILE = os.path.join(DATA_DIR, "match_midi", "Schubert_D783_no15_p01.mid")
+MATCH_FILE = os.path.join(DATA_DIR, "match", "Schubert_D783_no15_p01.match")
+
+class TrackCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cache = TrackCache(os.path.join(self.directory, "cache"), enabled=True)
+
+    def assertSameTrack(self, a, b):
+        for column in Track.COLUMNS:
+            np.testing.assert_array_equal(getattr(a, column), getattr(b, column))
+
+    def test_midi_track(self):
+        expected = read_track(MIDI_FILE, columnar=True)
+        self.assertSameTrack(self.cache.track(MIDI_FILE), expected)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        self.assertSameTrack(self.cache.track(MIDI_FILE), expected)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_match_track(self):
+        for score_notes in (True, False):
+            expected = events_from_match(MatchFile(MATCH_FILE), score_notes, columnar=True)
+            self.assertSameTrack(self.cache.track(MATCH_FILE, score_notes), expected)
+            self.assertSameTrack(self.cache.track(MATCH_FILE, score_notes), expected)
+
+    def test_match_table(self):
+        expected = MatchFile(MATCH_FILE).to_table()
+        for _ in range(2):
+            table = self.cache.match_table(MATCH_FILE)
+            np.testing.assert_array_equal(table.notes, expected.notes)
+            self.assertEqual((table.info, table.meta), (expected.info, expected.meta))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_content_key(self):
+        # a copy of a file uses its entries, a changed file does not
+        copy = os.path.join(self.directory, "copy.mid")
+        shutil.copyfile(MIDI_FILE, copy)
+        self.cache.track(MIDI_FILE)
+        self.cache.track(copy)
+        self.assertEqual(self.cache.hits, 1)
+        with open(copy, "ab") as output:
+            output.write(b"MTrk\0\0\0\0")
+        self.cache.track(copy)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_disabled(self):
+        cache = TrackCache(os.path.join(self.directory, "disabled"), enabled=False)
+        self.assertSameTrack(cache.track(MIDI_FILE), read_track(MIDI_FILE, columnar=True))
+        self.assertFalse(os.path.exists(cache.directory))
+
+    def test_evict(self):
+        self.cache.track(MIDI_FILE)
+        self.cache.track(MATCH_FILE, True) # its MatchTable and the track
+        entries = len(self.cache.entries())
+        self.cache.max_bytes = self.cache.size() - 1
+        self.cache.evict()
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+        self.assertEqual(len(self.cache.entries()), entries - 1)
+        self.cache.clear()
+        self.assertEqual(self.cache.entries(), [])
+
+if __name__ == '__main__':
+    unittest.main()
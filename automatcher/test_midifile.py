@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+import glob, os, struct, sys, tempfile, unittest
+import numpy as np
+import automatcher
+from automatcher import read_track, events_from_match, preprocess, show_event
+from midifile import read_notes
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "match_to_midi"))
+from match_to_midi import MatchFile
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+# .mid files match_to_midi wrote for the played notes of the first performance of every piece
+PERFORMANCES = sorted(glob.glob(os.path.join(DATA_DIR, "match_midi", "*_p01.mid")))
+
+# Delta times, running status, a NoteOn with velocity 0 and events that are skipped: tempo (meta), control
+# change, program change (one data byte) and sysex.
+TRACK = bytes([
+    0x00, 0xff, 0x51, 0x03, 0x07, 0xa1, 0x20,
+    0x00, 0x90, 60, 100,
+    0x10, 64, 90,
+    0x81, 0x00, 0xb0, 7, 100,
+    0x05, 0xc0, 3,
+    0x00, 0xf0, 0x02, 0x01, 0xf7,
+    0x20, 0x80, 60, 64,
+    0x08, 0x90, 64, 0,
+    0x00, 0xff, 0x2f, 0x00])
+
+def midi_file(directory, tracks, resolution=480):
+    filename = os.path.join(directory, "test.mid")
+    with open(filename, "wb") as output:
+        output.write(b"MThd" + struct.pack(">LHHH", 6, 1, len(tracks), resolution))
+        for track in tracks:
+            output.write(b"MTrk" + struct.pack(">L", len(track)) + track)
+    return filename
+
+class ReadNotesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_notes(self):
+        notes = read_notes(midi_file(self.directory, [TRACK]))
+        self.assertEqual(notes.resolution, 480)
+        self.assertEqual(notes.tick.tolist(), [0, 16, 32, 8])
+        self.assertEqual(notes.is_off.tolist(), [0, 0, 1, 0])
+        self.assertEqual(notes.pitch.tolist(), [60, 64, 60, 64])
+        self.assertEqual(notes.velocity.tolist(), [100, 90, 64, 0])
+        self.assertEqual(read_notes(midi_file(self.directory, [TRACK]), zero_velocity_off=True).is_off.tolist(),
+                [0, 0, 1, 1])
+
+    def test_tracks(self):
+        filename = midi_file(self.directory, [bytes([0x00, 0xff, 0x2f, 0x00]), TRACK])
+        self.assertEqual(len(read_notes(filename).tick), 0)
+        self.assertEqual(read_notes(filename, track_index=1).pitch.tolist(), [60, 64, 60, 64])
+        with self.assertRaises(IndexError):
+            read_notes(filename, track_index=2)
+
+    def test_not_midi(self):
+        filename = os.path.join(self.directory, "test.mid")
+        with open(filename, "wb") as output:
+            output.write(b"RIFF" + bytes(20))
+        with self.assertRaises(ValueError):
+            read_notes(filename)
+
+class ReadTrackTest(unittest.TestCase):
+    def test_match_files(self):
+        # the events events_from_match builds straight from the .match file the .mid file was written from
+        self.assertTrue(PERFORMANCES)
+        for filename in PERFORMANCES:
+            match_file = os.path.join(DATA_DIR, "match", os.path.basename(filename)[:-len(".mid")] + ".match")
+            with self.subTest(filename=os.path.basename(filename)):
+                self.assertEqual(list(map(show_event, read_track(filename))),
+                        list(map(show_event, events_from_match(MatchFile(match_file), score_notes=False))))
+
+    def test_columnar(self):
+        for filename in PERFORMANCES:
+            track = read_track(filename, columnar=True)
+            self.assertEqual(list(map(show_event, track)), list(map(show_event, read_track(filename))))
+            np.testing.assert_array_equal(track.keys, [event.key for event in read_track(filename)])
+
+    @unittest.skipIf(automatcher.midi is None, "python-midi is not installed")
+    def test_python_midi(self):
+        for filename in PERFORMANCES:
+            self.assertEqual(list(map(show_event, read_track(filename))),
+                    list(map(show_event, preprocess(automatcher.midi.read_midifile(filename)[0]))))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+import glob, os, time
+from decimal import Decimal
+from match_to_midi import MatchFile
+
+NOTE_FIELDS = ('is_score', 'is_old', 'anchor', 'note', 'is_sharp', 'octave', 'bar', 'beat', 'offset', 'duration',
+        'time_onset', 'time_offset', 'attributes', 'velocity')
+
+def note_content(note):
+    if note is None:
+        return None
+    content = []
+    for field in NOTE_FIELDS:
+        value = getattr(note, field, None)
+        if field in ('time_onset', 'time_offset'):
+            value = float(value)
+        elif field == 'velocity' and value is not None:
+            value = int(value)
+        content.append(value)
+    return content
+
+def event_ticks(match_file, score_notes):
+    # scaling used for this kind of file by generate_data.sh
+    is_old = 'matchFileVersion' not in match_file.info
+    scaling = Decimal((15000 if is_old else 4000) if score_notes else (1 if is_old else 8))
+    return match_file.get_events(time_scaling=scaling, score_notes=score_notes)
+
+def check_same(slow, fast):
+    if slow.info != fast.info or slow.meta != fast.meta or len(slow.matches) != len(fast.matches):
+        return False
+    for slow_pair, fast_pair in zip(slow.matches, fast.matches):
+        if list(map(note_content, slow_pair)) != list(map(note_content, fast_pair)):
+            return False
+    return all(event_ticks(slow, score_notes) == event_ticks(fast, score_notes) for score_notes in (True, False))
+
+def bench_parse(filenames, check=False):
+    lines = 0
+    for filename in filenames:
+        with open(filename) as match_file:
+            lines += sum(1 for line in match_file)
+    parsed = {}
+    for fast in (False, True):
+        start = time.perf_counter()
+        parsed[fast] = [MatchFile(filename, fast=fast) for filename in filenames]
+        elapsed = time.perf_counter() - start
+        print("{:<4} {} files, {} lines in {:.3f}s: {:.0f} lines/s".format(
+            "fast" if fast else "slow", len(filenames), lines, elapsed, lines / elapsed))
+    if check:
+        for filename, slow, fast in zip(filenames, parsed[False], parsed[True]):
+            if not check_same(slow, fast):
+                print("MISMATCH", os.path.basename(filename))
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks parsing of .match files.')
+    parser.add_argument('input_files', type=str, nargs='*',
+                        help='.match files, all of ../data/match by default')
+    parser.add_argument('--check', '-c', action='store_const',
+                        default = False, const = True,
+                        help='verifies that both parsers produce the same content and MIDI ticks')
+
+    args = parser.parse_args()
+    filenames = args.input_files or sorted(glob.glob("../data/match/*.match"))
+    bench_parse(filenames, check=args.check)
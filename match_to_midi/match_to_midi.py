@@ -1,7 +1,16 @@
 #!/usr/bin/python3
 
-import midi, re
+import os, re, struct, time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 from decimal import Decimal
+from collections import namedtuple
+
+try:
+    import midi
+except ImportError: # only needed for get_pattern, .mid files are written with write_event_arrays
+    midi = None
 
 """
 Looking at the Vienna 4x22 data, these are the relevant item names:
@@ -23,6 +32,10 @@ uses version 5.0 and an unknown version (likely older than 3.0).
 
 DEFAULT_VELOCITY = 64
 
+# Times parsed by the fast parser are floats, ticks computed from them get this much slack so that
+# they truncate the same way as the exact Decimal ones.
+FLOAT_TICK_TOLERANCE = 1e-6
+
 def parse_params(params):
     if params is None:
         return []
@@ -47,8 +60,32 @@ def parse_line(line):
         return ((name, parse_params(params)),)
     return None
 
+SNOTE_PATTERN = re.compile(r"snote\(([^,]*),\[([A-Za-z]),([^],]*)\],(-?\d+),(-?\d+):(-?\d+),([^,]*),([^,]*),([^,]*),([^,]*),\[([^]]*)\]\)")
+NOTE_PATTERN = re.compile(r"note\(([^,]*),\[([A-Za-z]),([^],]*)\],(-?\d+),([^,]*),([^,]*),(?:([^,]*),)?([^,)]*)\)")
+EMPTY_NOTE_NAMES = ('insertion', 'deletion', 'no_played_note')
+# Matches every line: the fields of a note line with a snote or an empty left side (11 + 1 groups) and a note
+# or an empty right side (8 + 1 groups), or the whole line (the last group) if it is anything else.
+ROW_PATTERN = re.compile(r"(?:" + SNOTE_PATTERN.pattern + r"|(" + "|".join(EMPTY_NOTE_NAMES) + r"))-(?:"
+        + NOTE_PATTERN.pattern + r"|(" + "|".join(EMPTY_NOTE_NAMES) + r"))\.|(.*)")
+
 class Note:
+    __slots__ = ('is_old', 'is_score', 'anchor', 'note', 'is_sharp', 'octave', 'bar', 'beat', 'offset', 'duration',
+            'time_onset', 'time_offset', 'attributes', 'velocity')
+
     NOTES = ['c', 'c#', 'd', 'd#', 'e', 'f', 'f#', 'g', 'g#', 'a', 'a#', 'b', 'b#']
+    # (lowercase note name, modifier) -> (note, is_sharp), the same mapping as __init__ does
+    NAMES = {}
+    # (note name in either case, modifier) of the fields of SNOTE_PATTERN and NOTE_PATTERN -> index of the note
+    # in NOTES, None for the notes midi_note_number can not find there (e#)
+    FIELD_NAMES = {}
+    for name in 'abcdefg':
+        NAMES[name, 'n'] = (name, False)
+        NAMES[name, '#'] = (name + '#', True)
+        NAMES[name, 'b'] = (NOTES[NOTES.index(name) - 1], True)
+        for modifier in 'n#b':
+            note = NAMES[name, modifier][0]
+            FIELD_NAMES[name, modifier] = FIELD_NAMES[name.upper(), modifier] = NOTES.index(note) if note in NOTES else None
+    del name, modifier, note
 
     def __init__(self, parsed_line, is_old):
         name, data = parsed_line
@@ -102,6 +139,46 @@ class Note:
         else:
             raise ValueError("Invalid note line: {}".format(parsed_line))
 
+    # Fast constructors for the groups of SNOTE_PATTERN and NOTE_PATTERN, times are floats instead of Decimals.
+    # Return None if the fields are not valid, __init__ reports the error then.
+    @staticmethod
+    def from_snote_fields(fields, is_old):
+        anchor, name, modifier, octave, bar, beat, offset, duration, beat_number, beat_duration, attr_list = fields
+        note_name = Note.NAMES.get((name.lower(), modifier))
+        if note_name is None:
+            return None
+        self = Note.__new__(Note)
+        self.is_old = is_old
+        self.is_score = True
+        self.anchor = anchor
+        self.note, self.is_sharp = note_name
+        self.octave = int(octave)
+        self.bar = int(bar)
+        self.beat = int(beat)
+        self.offset = offset
+        self.duration = duration
+        self.time_onset = float(beat_number)
+        self.time_offset = float(beat_duration)
+        self.attributes = attr_list.split(",")
+        return self
+
+    @staticmethod
+    def from_note_fields(fields, is_old):
+        anchor, name, modifier, octave, onset, offset, adj_offset, velocity = fields
+        note_name = Note.NAMES.get((name.lower(), modifier))
+        if note_name is None or (adj_offset is not None and adj_offset != offset):
+            return None
+        self = Note.__new__(Note)
+        self.is_old = is_old
+        self.is_score = False
+        self.anchor = int(anchor)
+        self.note, self.is_sharp = note_name
+        self.octave = int(octave)
+        self.time_onset = float(onset)
+        self.time_offset = float(offset)
+        self.velocity = int(velocity)
+        return self
+
     @property
     def midi_note_number(self):
         starts_from_one = 0 if self.is_old else 1
@@ -147,94 +224,425 @@ class Note:
             return None
         return Note(parsed_note, is_old)
 
+# A Note of the fields of SNOTE_PATTERN (score notes) or NOTE_PATTERN, Notes and None are returned as they are.
+def _field_note(note, is_old, is_score):
+    if type(note) is not tuple:
+        return note
+    return Note.from_snote_fields(note, is_old) if is_score else Note.from_note_fields(note, is_old)
+
+def _row_notes(row):
+    score_note, played_note, is_old = row
+    return _field_note(score_note, is_old, True), _field_note(played_note, is_old, False)
+
+# Onsets, offsets, note numbers and velocities of (pair, fields, is_old) of SNOTE_PATTERN (score notes) or
+# NOTE_PATTERN as arrays, the same values the Notes of the fields have.
+def _field_columns(notes, is_score):
+    columns = list(zip(*(fields for _, fields, _ in notes))) or [()] * 11
+    onsets, offsets = (columns[8], columns[9]) if is_score else (columns[4], columns[5])
+    octaves = np.array(columns[3], dtype=np.int64) + np.array([not is_old for _, _, is_old in notes], dtype=np.int64)
+    pitch_classes = [Note.FIELD_NAMES[name] for name in zip(columns[1], columns[2])]
+    if None in pitch_classes: # midi_note_number fails on these too
+        index = pitch_classes.index(None)
+        raise ValueError("Note {}{} has no MIDI note number.".format(columns[1][index], columns[2][index]))
+    if is_score:
+        velocities = np.full(len(notes), DEFAULT_VELOCITY, dtype=np.int64)
+    else:
+        velocities = np.array(columns[7], dtype=np.int64)
+    return (np.array(onsets, dtype=np.float64), np.array(offsets, dtype=np.float64),
+            12 * octaves + np.array(pitch_classes, dtype=np.int64), velocities)
+
 class MatchFile:
-    def __init__(self, match_file):
+    # fast=True (the default) parses every line with one precompiled pattern (ROW_PATTERN) and keeps the fields
+    # of note lines, Note objects with float times are only made when the matches are used and events are built
+    # on arrays straight from the fields. fast=False keeps exact Decimal times, events are then built one by one.
+    # lazy=True only parses info and meta lines up front, matches are then parsed from the file every time
+    # iter_matches() (or score_notes, played_notes) is used and self.matches is None. If match_file is
+    # an unseekable file object the matches can only be iterated once and meta lines that follow the notes
+    # are only known after that.
+    def __init__(self, match_file, fast=True, lazy=False):
+        self.filename = None
         if isinstance(match_file, str):
+            self.filename = match_file
             match_file = open(match_file)
+        self.fast = fast
         self.info = {}
         self.meta = {}
-        self.matches = []
-        for line in match_file:
+        self._rows = None
+        self._matches = None
+        if lazy:
+            self._file = match_file
+            self._read_header()
+        else:
+            self._rows = list(self._parse_rows(match_file, True))
+
+    @property
+    def matches(self):
+        if self._matches is None and self._rows is not None:
+            self._matches = list(map(_row_notes, self._rows))
+        return self._matches
+
+    def _add_solo(self, parsed):
+        data_name, data = parsed[0]
+        if data_name == 'info':
+            self.info[data[0]] = data[1]
+        elif data_name == 'meta': # possible collisions with info
+            self.meta[data[0]] = data[1:]
+        else:
+            pass # ?
+
+    def _read_header(self):
+        match_file = self._file
+        self._body_offset = None
+        self._first_line = None
+        self._seekable = match_file.seekable()
+        while True:
+            offset = match_file.tell() if self._seekable else None
+            line = match_file.readline()
+            if not line:
+                break
+            parsed = parse_line(line)
+            if parsed is None or len(parsed) != 1:
+                self._body_offset = offset
+                self._first_line = line
+                break
+            self._add_solo(parsed)
+        self._header_is_old = not 'matchFileVersion' in self.info
+        if self._seekable and self._body_offset is not None:
+            # info/meta lines may also follow the notes (meta lines do in version 5.0)
+            for line in match_file:
+                if line.startswith(('info(', 'meta(')):
+                    parsed = parse_line(line)
+                    if parsed is not None and len(parsed) == 1:
+                        self._add_solo(parsed)
+        if self.filename is not None and self._seekable:
+            match_file.close() # reopened for every iteration
+
+    # (score note, played note, is_old) of every note line. A note is None, a Note, or with the fast parser the
+    # fields of SNOTE_PATTERN or NOTE_PATTERN (a tuple) that _row_notes makes a Note of.
+    def _parse_rows(self, lines, is_old):
+        for line in lines:
+            if self.fast:
+                fields = ROW_PATTERN.match(line).groups()
+                if fields[21] is None:
+                    score = fields[:11] if fields[0] is not None else None
+                    played = fields[12:20] if fields[12] is not None else None
+                    if ((score is None or (score[1], score[2]) in Note.FIELD_NAMES) and (played is None
+                            or ((played[1], played[2]) in Note.FIELD_NAMES and played[6] in (None, played[5])))):
+                        yield score, played, is_old
+                        continue
+                # anything else goes through parse_line
             parsed = parse_line(line)
             if parsed is None:
                 raise ValueError("Invalid file format: {}".format(line))
             if len(parsed) == 1:
-                data_name, data = parsed[0]
-                if data_name == 'info':
-                    self.info[data[0]] = data[1]
-                elif data_name == 'meta': # possible collisions with info
-                    self.meta[data[0]] = data[1:]
-                else:
-                    pass # ?
-            elif len(parsed) == 2:
+                self._add_solo(parsed)
                 is_old = not 'matchFileVersion' in self.info
-                self.matches.append((
-                    Note.from_parsed(parsed[0], is_old), 
-                    Note.from_parsed(parsed[1], is_old)))
+            elif len(parsed) == 2:
+                yield Note.from_parsed(parsed[0], is_old), Note.from_parsed(parsed[1], is_old), is_old
+
+    def _body_rows(self):
+        if self._rows is not None:
+            yield from self._rows
+            return
+        if self._first_line is None:
+            return
+        if not self._seekable:
+            if self._file is None:
+                raise ValueError("Matches of an unseekable match file can only be iterated once.")
+            match_file, self._file = self._file, None
+            yield from self._parse_rows(chain((self._first_line,), match_file), self._header_is_old)
+            return
+        if self.filename is not None:
+            with open(self.filename) as match_file:
+                match_file.seek(self._body_offset)
+                yield from self._parse_rows(match_file, self._header_is_old)
+        else:
+            self._file.seek(self._body_offset)
+            yield from self._parse_rows(self._file, self._header_is_old)
+
+    def iter_matches(self):
+        if self.matches is not None:
+            return iter(self.matches)
+        return map(_row_notes, self._body_rows())
 
     @property
     def score_notes(self):
-        for score_note, _ in self.matches:
+        for score_note, _ in self.iter_matches():
             if score_note is not None:
                 yield score_note
 
     @property
     def played_notes(self):
-        for _, played_note in self.matches:
+        for _, played_note in self.iter_matches():
             if played_note is not None:
                 yield played_note
-                
-    def get_pattern(self, time_scaling=Decimal(1.0), score_notes=True):
+
+    def _note_columns(self, score_notes, rows=None, exact=True):
+        # Pairs, onsets, offsets, note numbers and velocities of the notes, or with exact the notes if a time is a
+        # Decimal (float times otherwise). Fields of the fast parser are converted column by column without
+        # making Notes.
+        side = 0 if score_notes else 1
+        notes = [(pair, row[side], row[2]) for pair, row in enumerate(self._body_rows() if rows is None else rows)
+                if row[side] is not None]
+        pairs = np.array([pair for pair, _, _ in notes], dtype=np.int64)
+        if all(type(note) is tuple for _, note, _ in notes):
+            return None, (pairs,) + _field_columns(notes, score_notes)
+        notes = [_field_note(note, is_old, score_notes) for _, note, is_old in notes]
+        if exact and any(isinstance(note.time_onset, Decimal) or isinstance(note.time_offset, Decimal) for note in notes):
+            return notes, None
+        return notes, (pairs, [float(note.time_onset) for note in notes], [float(note.time_offset) for note in notes],
+                [note.midi_note_number for note in notes],
+                [int(note.velocity) if hasattr(note, 'velocity') else DEFAULT_VELOCITY for note in notes])
+
+    # Note on/off events in the order get_pattern writes them, as (tick, is_off, note number, velocity) where
+    # tick is the time since the previous event. quantize=False keeps the exact scaled time differences.
+    # Float times (fast parser) are sorted on arrays (note_event_arrays), Decimal times exactly one by one.
+    def get_events(self, time_scaling=Decimal(1.0), score_notes=True, quantize=True):
+        notes, columns = self._note_columns(score_notes)
+        if columns is not None:
+            return events_from_arrays(note_event_arrays(*columns[1:], time_scaling, quantize))
         events = []
-        for note in self.score_notes if score_notes else self.played_notes:
+        for note in notes:
             events.append(note.on_event)
             events.append(note.off_event)
-        events = sorted(events)
-
-        time_scalind = 10000
-        current_time = None
-        track = midi.Track()
-        #track.append(midi.SetTempoEvent(tick=0, data=[7, 161, 32]))
-        for time, is_off, note_number, vel in events:
-            if current_time is None:
-                current_time = time
-            tick = int((time - current_time) * time_scaling)
-            if is_off:
-                track.append(midi.NoteOffEvent(tick=tick, pitch=note_number, velocity=64))
-            else:
-                track.append(midi.NoteOnEvent(tick=tick, pitch=note_number, velocity=vel))
+        return delta_events(sorted(events), time_scaling, quantize)
+
+    # get_events as arrays: ticks, is_off, note numbers and velocities.
+    def get_event_arrays(self, time_scaling=Decimal(1.0), score_notes=True):
+        _, columns = self._note_columns(score_notes)
+        if columns is not None:
+            return note_event_arrays(*columns[1:], time_scaling)
+        return event_arrays(self.get_events(time_scaling, score_notes))
+
+    def get_pattern(self, time_scaling=Decimal(1.0), score_notes=True):
+        return pattern_from_events(self.get_events(time_scaling, score_notes), self.info)
+
+    def default_time_scaling(self, score_notes=True):
+        return default_time_scaling(self.info, score_notes)
+
+    # The notes as a MatchTable, one row per score or played note.
+    def to_table(self):
+        rows = list(self._body_rows())
+        sides = [self._note_columns(score_notes, rows, exact=False)[1] for score_notes in (True, False)]
+        notes = np.zeros(sum(len(columns[0]) for columns in sides), dtype=MatchTable.DTYPE)
+        for field, index in (('pair', 0), ('time_onset', 1), ('time_offset', 2), ('pitch', 3), ('velocity', 4)):
+            notes[field] = np.concatenate([np.asarray(columns[index]) for columns in sides])
+        notes['is_score'][:len(sides[0][0])] = True
+        # pair by pair, the score note first
+        notes = notes[np.argsort(notes['pair'], kind="stable")]
+        return MatchTable(self.info, self.meta, notes)
+
+class MatchTable:
+    # Compact columnar copy of the notes of a MatchFile (e.g. for caching), enough to write the same MIDI
+    # events. Times are floats like the ones of the fast parser. Only the notes are kept, not the
+    # anchors, bars or attributes.
+    DTYPE = np.dtype([('pair', '<i4'), ('is_score', '?'), ('pitch', '<i2'), ('time_onset', '<f8'),
+            ('time_offset', '<f8'), ('velocity', '<i2')])
+
+    def __init__(self, info, meta, notes):
+        self.info = info
+        self.meta = meta
+        self.notes = notes
+
+    def get_events(self, time_scaling=Decimal(1.0), score_notes=True, quantize=True):
+        return events_from_arrays(self.get_event_arrays(time_scaling, score_notes, quantize))
+
+    def get_event_arrays(self, time_scaling=Decimal(1.0), score_notes=True, quantize=True):
+        notes = self.notes[self.notes['is_score'] == score_notes]
+        return note_event_arrays(notes['time_onset'], notes['time_offset'], notes['pitch'], notes['velocity'],
+                time_scaling, quantize)
+
+    def get_pattern(self, time_scaling=Decimal(1.0), score_notes=True):
+        return pattern_from_events(self.get_events(time_scaling, score_notes), self.info)
+
+    def default_time_scaling(self, score_notes=True):
+        return default_time_scaling(self.info, score_notes)
+
+# Sorted (time, is_off, note number, velocity) note events to (tick, is_off, note number, velocity)
+# with the tick since the previous event.
+def delta_events(events, time_scaling, quantize=True):
+    float_times = len(events) > 0 and not isinstance(events[0][0], Decimal)
+    if float_times:
+        time_scaling = float(time_scaling)
+
+    current_time = None
+    result = []
+    for time, is_off, note_number, vel in events:
+        if current_time is None:
             current_time = time
+        tick = (time - current_time) * time_scaling
+        if quantize:
+            tick = int(tick + FLOAT_TICK_TOLERANCE) if float_times else int(tick)
+        result.append((tick, is_off, note_number, 64 if is_off else vel))
+        current_time = time
+    return result
 
-        track.append(midi.EndOfTrackEvent(tick=1))
-        pattern = midi.Pattern()
-        pattern.resolution = int(self.info['midiClockUnits']) 
-        pattern.append(track)
-        return pattern
+EventArrays = namedtuple("EventArrays", ["tick", "is_off", "pitch", "velocity"])
+
+# delta_events(sorted(events)) of the on and off events of notes with float onset and offset times, note
+# numbers and velocities (negative ones are 0 like in get_event) as EventArrays. One stable sort by time and
+# a key packing (is_off, note number, velocity), then the ticks of all events in one pass.
+def note_event_arrays(onsets, offsets, pitches, velocities, time_scaling, quantize=True):
+    count = len(onsets)
+    times = np.concatenate((np.asarray(onsets, dtype=np.float64), np.asarray(offsets, dtype=np.float64)))
+    is_off = np.arange(2 * count) >= count
+    pitches = np.tile(np.asarray(pitches, dtype=np.int64), 2)
+    velocities = np.tile(np.maximum(np.asarray(velocities, dtype=np.int64), 0), 2)
+    keys = (is_off.astype(np.int64) << 40) | ((pitches + (1 << 19)) << 20) | velocities
+    order = np.lexsort((keys, times))
+    times, is_off, pitches, velocities = times[order], is_off[order], pitches[order], velocities[order]
+    ticks = np.diff(times, prepend=times[:1]) * float(time_scaling)
+    if quantize:
+        ticks = (ticks + FLOAT_TICK_TOLERANCE).astype(np.int64)
+    velocities[is_off] = 64
+    return EventArrays(ticks, is_off, pitches, velocities)
+
+# The (tick, is_off, note number, velocity) tuples get_events returns.
+def events_from_arrays(arrays):
+    return list(zip(*(column.tolist() for column in arrays)))
+
+def event_arrays(events):
+    if not events:
+        return EventArrays(*(np.zeros(0, dtype=dtype) for dtype in (np.int64, bool, np.int64, np.int64)))
+    ticks, is_off, pitches, velocities = zip(*events)
+    return EventArrays(np.array(ticks, dtype=np.int64), np.array(is_off, dtype=bool), np.array(pitches, dtype=np.int64),
+            np.array(velocities, dtype=np.int64))
+
+# Writes EventArrays as the .mid file midi.write_midifile writes for pattern_from_events: format 1 with one
+# track, every event with its status byte (channel 0, no running status), end of track one tick later.
+# The bytes of all events are built at once.
+def write_event_arrays(output_file, arrays, resolution):
+    ticks = np.asarray(arrays.tick, dtype=np.int64)
+    if len(ticks) and (ticks.min() < 0 or ticks.max() >= 1 << 35):
+        raise ValueError("Ticks have to be between 0 and 2^35.")
+    lengths = 1 + sum(ticks >= 1 << bits for bits in (7, 14, 21, 28)) # bytes of the variable length quantities
+    rows = np.arange(len(ticks))
+    data = np.zeros((len(ticks), 8), dtype=np.uint8)
+    groups = lengths[:, None] - 1 - np.arange(5) # 7 bit group of each byte, most significant first
+    quantity = ((ticks[:, None] >> (7 * np.maximum(groups, 0))) & 0x7f) | np.where(groups > 0, 0x80, 0)
+    data[:, :5] = np.where(groups >= 0, quantity, 0)
+    data[rows, lengths] = np.where(arrays.is_off, 0x80, 0x90)
+    data[rows, lengths + 1] = arrays.pitch
+    data[rows, lengths + 2] = arrays.velocity
+    track = data[np.arange(8) < (lengths + 3)[:, None]].tobytes() + b"\x01\xff\x2f\x00"
+    with open(output_file, "wb") as output:
+        output.write(b"MThd" + struct.pack(">LHHH", 6, 1, 1, resolution))
+        output.write(b"MTrk" + struct.pack(">L", len(track)))
+        output.write(track)
+
+def pattern_from_events(events, info):
+    if midi is None:
+        raise ImportError("python-midi is needed to write MIDI patterns")
+    track = midi.Track()
+    #track.append(midi.SetTempoEvent(tick=0, data=[7, 161, 32]))
+    event_types = (midi.NoteOnEvent, midi.NoteOffEvent)
+    track.extend([event_types[is_off](tick=tick, pitch=note_number, velocity=vel)
+            for tick, is_off, note_number, vel in events])
+
+    track.append(midi.EndOfTrackEvent(tick=1))
+    pattern = midi.Pattern()
+    pattern.resolution = int(info['midiClockUnits']) 
+    pattern.append(track)
+    return pattern
+
+# Time scaling derived from the header. Score times are in beats, one beat becomes one quarter note of
+# midiClockUnits ticks. Played times are in MIDI clock units in old files (no matchFileVersion) and in
+# milliseconds in version 5.0, where midiClockRate microseconds are one quarter note.
+# (generate_data.sh used 15000 for old scores by hand, this only changes their tempo, not their order.)
+def default_time_scaling(info, score_notes=True):
+    clock_units = Decimal(info.get('midiClockUnits', 4000))
+    if score_notes:
+        return clock_units
+    if not 'matchFileVersion' in info:
+        return Decimal(1)
+    return clock_units * 1000 / Decimal(info.get('midiClockRate', 500000))
+
+# Converts the score or played notes of a .match file to a .mid file, returns the number of notes.
+def convert_file(input_file, output_file, score_notes=True, time_scaling=None):
+    match_file = MatchFile(input_file, fast=True, lazy=True)
+    if time_scaling is None:
+        time_scaling = match_file.default_time_scaling(score_notes)
+    arrays = match_file.get_event_arrays(time_scaling, score_notes)
+    write_event_arrays(output_file, arrays, int(match_file.info['midiClockUnits']))
+    return len(arrays.tick) // 2
+
+def _convert_file(arguments):
+    return arguments[1], convert_file(*arguments)
+
+# Conversion jobs for a directory laid out like data/match: every <piece>_pNN.match gives <piece>_pNN.mid
+# with the played notes, the first file of every piece also gives <piece>_score.mid with the score notes.
+def conversion_jobs(input_dir, output_dir, time_scaling=None):
+    pieces = set()
+    for name in sorted(os.listdir(input_dir)):
+        if not name.endswith(".match"):
+            continue
+        input_file = os.path.join(input_dir, name)
+        piece = re.sub(r"_p\d+$", "", name[:-len(".match")])
+        if piece not in pieces:
+            pieces.add(piece)
+            yield input_file, os.path.join(output_dir, piece + "_score.mid"), True, time_scaling
+        yield input_file, os.path.join(output_dir, name[:-len(".match")] + ".mid"), False, time_scaling
+
+def is_up_to_date(input_file, output_file):
+    return os.path.exists(output_file) and os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+
+def convert_directory(input_dir, output_dir, time_scaling=None, workers=None, force=False, verbose=True):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [job for job in conversion_jobs(input_dir, output_dir, time_scaling)
+            if force or not is_up_to_date(job[0], job[1])]
+    start = time.perf_counter()
+    empty = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for output_file, notes in executor.map(_convert_file, jobs):
+            if verbose:
+                print(output_file, notes)
+            if notes == 0:
+                empty.append(output_file)
+    elapsed = time.perf_counter() - start
+    print("{} files converted in {:.3f}s: {:.1f} files/s".format(len(jobs), elapsed, len(jobs) / elapsed if elapsed else 0))
+    if empty:
+        print("Empty tracks:", *empty)
+    return empty
 
 if __name__ == '__main__':
 
     import argparse
 
-    parser = argparse.ArgumentParser(description='Converts .match file to .mid file.')
+    parser = argparse.ArgumentParser(description='Converts .match file to .mid file, or every .match file in a directory.')
     parser.add_argument('input_file', type=str,
-                        help='input .match file')
+                        help='input .match file or directory with .match files')
     parser.add_argument('output_file', type=str,
-                        help='output .mid file')
+                        help='output .mid file or directory')
     parser.add_argument('--notes', '-n', dest='notes',
                         default='score', choices=['score', 'played'],
-                        help='"score" or "played" - which notes you want to convert, score is default')
+                        help='"score" or "played" - which notes you want to convert, score is default (ignored for directories)')
     parser.add_argument('--scaling', '-s', dest='scaling',
-                        default="1.0", type=str,
-                        help='time scaling of events in the .mid file')
+                        default=None, type=str,
+                        help='time scaling of events in the .mid file, 1.0 by default for a file and derived from '
+                        'the header of every file (see MatchFile.default_time_scaling) for a directory')
     parser.add_argument('--debug', '-d', action='store_const',
                         default = False, const = True,
                         help='prints debug information')
+    parser.add_argument('--exact', '-e', action='store_const',
+                        default = False, const = True,
+                        help='parses times as Decimals and builds events one by one instead of the fast parser '
+                        'and arrays (ignored for directories)')
+    parser.add_argument('--workers', '-w', dest='workers', type=int, default=None,
+                        help='number of worker processes for a directory, number of CPUs by default')
+    parser.add_argument('--force', action='store_const',
+                        default = False, const = True,
+                        help='converts files of a directory even if the .mid file is newer than the .match file')
 
     args = parser.parse_args()
-    score_notes = args.notes == 'score'
-    match_file = MatchFile(args.input_file)
-    pattern = match_file.get_pattern(time_scaling=Decimal(args.scaling), score_notes=score_notes)
-    if args.debug:
-        print(pattern)
-    midi.write_midifile(args.output_file, pattern)
-
+    if os.path.isdir(args.input_file):
+        time_scaling = Decimal(args.scaling) if args.scaling is not None else None
+        convert_directory(args.input_file, args.output_file, time_scaling=time_scaling, workers=args.workers,
+                force=args.force, verbose=args.debug)
+    else:
+        score_notes = args.notes == 'score'
+        match_file = MatchFile(args.input_file, fast=not args.exact)
+        time_scaling = Decimal(args.scaling or "1.0")
+        if args.debug:
+            print(match_file.get_pattern(time_scaling=time_scaling, score_notes=score_notes))
+        write_event_arrays(args.output_file, match_file.get_event_arrays(time_scaling, score_notes),
+                int(match_file.info['midiClockUnits']))
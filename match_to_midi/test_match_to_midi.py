@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+import glob, io, os, unittest
+import numpy as np
+from match_to_midi import MatchFile
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "match")
+# the first performance of every piece, Chopin and Mozart files are of the old format, the others of version 5.0
+FILES = sorted(glob.glob(os.path.join(DATA_DIR, "*_p01.match")))
+
+# Note lines without an adjusted offset, insertions, deletions and a meta line among the notes (which the fast
+# parser leaves to parse_line) are parsed like the slow parser does.
+TEXT = """info(matchFileVersion,5.0).
+info(midiClockUnits,4000).
+info(midiClockRate,500000).
+snote(n1,[C,n],4,1:1,0,1/4,0.0,1.0,[])-note(0,[C,n],4,4000,6000,6000,60).
+snote(n2,[E,b],4,1:2,0,1/4,1.0,2.0,[staff1])-note(1,[D,#],4,6100,8000,70).
+meta(keySignature,C Maj,1,0.0).
+insertion-note(2,[G,#],5,6150,7000,7000,30).
+snote(n3,[B,#],3,1:3,0,1/4,2.0,3.0,[])-deletion.
+snote(n4,[a,n],4,1:4,0,1/4,3.0,4.0,[])-no_played_note.
+"""
+
+class FastParserTest(unittest.TestCase):
+    def assertSameNotes(self, fast, slow):
+        for score_notes in (True, False):
+            scaling = slow.default_time_scaling(score_notes)
+            for a, b in zip(fast.get_event_arrays(scaling, score_notes), slow.get_event_arrays(scaling, score_notes)):
+                np.testing.assert_array_equal(a, b)
+            self.assertEqual(fast.get_events(scaling, score_notes), slow.get_events(scaling, score_notes))
+        np.testing.assert_array_equal(fast.to_table().notes, slow.to_table().notes)
+        self.assertEqual(fast.info, slow.info)
+        self.assertEqual(fast.meta, slow.meta)
+
+    def test_corpus(self):
+        self.assertTrue(FILES)
+        for filename in FILES:
+            with self.subTest(filename=os.path.basename(filename)):
+                self.assertSameNotes(MatchFile(filename), MatchFile(filename, fast=False))
+
+    def test_fallback_lines(self):
+        self.assertSameNotes(MatchFile(io.StringIO(TEXT)), MatchFile(io.StringIO(TEXT), fast=False))
+
+    def test_notes(self):
+        # Notes of the fields have float times, otherwise they are the Notes of the slow parser
+        for fast, slow in zip(MatchFile(io.StringIO(TEXT)).matches, MatchFile(io.StringIO(TEXT), fast=False).matches):
+            for a, b in zip(fast, slow):
+                self.assertEqual(a is None, b is None)
+                if a is not None:
+                    self.assertEqual((a.midi_note_number, a.is_score, float(a.time_onset), float(a.time_offset)),
+                            (b.midi_note_number, b.is_score, float(b.time_onset), float(b.time_offset)))
+
+    def test_no_note_number(self):
+        text = TEXT.replace("[B,#],3", "[E,#],3")
+        with self.assertRaises(ValueError):
+            MatchFile(io.StringIO(text)).get_event_arrays()
+
+# A file object that can only be read once, like a pipe.
+class Stream(io.StringIO):
+    def seekable(self):
+        return False
+
+def note_tuples(match_file):
+    return [tuple(None if note is None else (note.midi_note_number, note.is_score, float(note.time_onset),
+            float(note.time_offset)) for note in notes) for notes in match_file.iter_matches()]
+
+class LazyMatchFileTest(unittest.TestCase):
+    def test_same_notes(self):
+        for filename in FILES[:2]:
+            for fast in (True, False):
+                lazy, eager = MatchFile(filename, fast=fast, lazy=True), MatchFile(filename, fast=fast)
+                self.assertIsNone(lazy.matches)
+                self.assertEqual(note_tuples(lazy), note_tuples(eager))
+                for a, b in zip(lazy.get_event_arrays(), eager.get_event_arrays()):
+                    np.testing.assert_array_equal(a, b)
+                np.testing.assert_array_equal(lazy.to_table().notes, eager.to_table().notes)
+
+    def test_header(self):
+        # meta lines among or after the notes are known before the matches are parsed
+        lazy = MatchFile(io.StringIO(TEXT), lazy=True)
+        eager = MatchFile(io.StringIO(TEXT))
+        self.assertEqual((lazy.info, lazy.meta), (eager.info, eager.meta))
+        matches = note_tuples(lazy)
+        self.assertEqual(note_tuples(lazy), matches) # parsed from the file again
+        self.assertEqual(matches, note_tuples(eager))
+
+    def test_unseekable(self):
+        lazy = MatchFile(Stream(TEXT), lazy=True)
+        self.assertEqual(note_tuples(lazy), note_tuples(MatchFile(io.StringIO(TEXT))))
+        self.assertEqual(lazy.meta, MatchFile(io.StringIO(TEXT)).meta)
+        with self.assertRaises(ValueError):
+            list(lazy.iter_matches())
+
+if __name__ == '__main__':
+    unittest.main()